@@ -0,0 +1,345 @@
+import threading
+import time
+import numpy as np
+from analysis import AveragedSpectrum
+from fpga_link import (encode_steady_stimulus, encode_transient_stimulus, encode_transient_codes, encode_frames,
+                       write_frames, read_codes, drain_input, codes_to_volts, make_decoder, STEADY_CALIBRATION,
+                       TRANSIENT_CALIBRATION, FRAMING_PLAIN)
+
+# 稳态采集点数及采样率
+NUM_SAMPLES = 60000
+FS = 600000
+# FPGA流水线延迟，前120个点丢弃
+PIPELINE_DELAY = 120
+# 平均频谱模式的默认采集次数
+AVERAGE_CAPTURES = 4
+# 瞬态采集：触发前最多采集的点数、触发后继续采集的点数、计算均值时跳过的点数
+TRANSIENT_SAMPLES = 20000
+POST_TRIGGER = 100
+TRANSIENT_SKIP = 20
+# 每次读取的点数，两次读取之间检查取消标志
+CHUNK_SAMPLES = 2048
+# 连续触发模式：环形缓冲区容量、默认触发前/后保留的点数
+RING_CAPACITY = 1 << 17
+PRE_TRIGGER = 2000
+POST_TRIGGER_WINDOW = 2000
+
+
+# 取消标志，可在其他线程中设置
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+#给信号添加白噪声
+def add_noise(data, noise_level):
+    noise = np.random.randn(len(data)) * np.sqrt(noise_level)
+    return data + noise
+
+
+# 稳态激励信号
+def steady_stimulus():
+    f1 = 125
+    f2 = 1200
+    f3 = 3005
+    f4 = 5000
+    t = np.linspace(0, 0.15, 90000)
+    data_to_send=1.5+0.3*np.sin(2*np.pi*f1*t)+0.1*np.sin(2*np.pi*f2*t)\
+                +0.1*np.sin(2*np.pi*f3*t)+0.05*np.sin(2*np.pi*f4*t)\
+                 +0.1*np.sin(2*np.pi*10000*t)+0.05*np.sin(2*np.pi*20000*t)
+    return add_noise(data_to_send, 0.001)   #添加白噪声
+
+
+# 瞬态激励信号
+def transient_stimulus():
+    f1 = 100
+    f2 = 1200
+    f3 = 3000
+    f4 = 5000
+    t = np.linspace(0, 1, 60000)
+    data_to_send=1.5+0.3*np.sin(2*np.pi*f1*t)+0.1*np.sin(2*np.pi*f2*t)\
+                +0.1*np.sin(2*np.pi*f3*t)+0.05*np.sin(2*np.pi*f4*t)\
+                 +0.1*np.sin(2*np.pi*10000*t)+0.05*np.sin(2*np.pi*20000*t)
+    return add_noise(data_to_send, 0.001)   #添加白噪声
+
+
+# 稳态采集：发送激励并读取NUM_SAMPLES个点；取消时返回None，读超时收不满时引发TimeoutError
+# progress(已读点数, 总点数, 本块电压数据)；timer: 可选的StageTimer，记录编码、发送、接收阶段
+# framing: 链路帧格式（见fpga_link.FRAMINGS）；link_stats: 可选的LinkStats，记录本次采集的链路错误
+# calibration: 码值 -> 电压的修正参数（见fpga_link.codes_to_volts），按设备和增益选择
+# keep_codes: 为True时返回 (数据, 原始码值)，用于改变增益后按该增益的修正参数重新换算
+def capture_steady(ser, cancel=None, progress=None, timer=None, framing=FRAMING_PLAIN, link_stats=None,
+                   calibration=STEADY_CALIBRATION, keep_codes=False):
+    t0 = time.perf_counter()
+    stimulus = steady_stimulus()
+    payload = encode_steady_stimulus(stimulus, framing)
+    t1 = time.perf_counter()
+    write_frames(ser, payload, cancel=cancel)
+    t2 = time.perf_counter()
+
+    total = NUM_SAMPLES + PIPELINE_DELAY
+    decoder = make_decoder(framing)
+    data = np.empty(total)
+    raw = np.empty(total, dtype=np.uint16) if keep_codes else None
+    got = 0
+    while got < total:
+        if cancel is not None and cancel.cancelled:
+            return None
+        codes = read_codes(ser, min(CHUNK_SAMPLES, total - got), decoder)
+        if not codes.size:
+            break
+        volts = codes_to_volts(codes, calibration)
+        data[got:got + len(volts)] = volts
+        if keep_codes:
+            raw[got:got + len(codes)] = codes
+        got += len(volts)
+        if progress is not None:
+            progress(got, total, volts)
+    if got < total:
+        raise TimeoutError(f'读超时: 只收到 {got}/{total} 个点')
+    if timer is not None:
+        record_link(timer, t0, t1, t2, len(stimulus), len(payload), got, decoder.bytes_in)
+    if link_stats is not None:
+        link_stats.add(decoder, PIPELINE_DELAY, got - PIPELINE_DELAY)
+    if keep_codes:
+        return data[PIPELINE_DELAY:got], raw[PIPELINE_DELAY:got]
+    return data[PIPELINE_DELAY:got]
+
+
+# 记录一次采集的编码、发送、接收阶段（接收阶段到当前时刻为止）
+def record_link(timer, t0, t1, t2, sent_samples, sent_bytes, samples, received_bytes):
+    timer.record('encode', t1 - t0, sent_samples, sent_bytes)
+    timer.record('write', t2 - t1, sent_samples, sent_bytes)
+    timer.record('read', time.perf_counter() - t2, samples, received_bytes)
+
+
+# 多次稳态采集平均：每块数据到达时即累加到平均频谱，取消时返回None
+# 返回 (最后一次采集的数据, 平均频谱)；keep_codes为True时再返回每次采集的原始码值列表
+def capture_averaged(ser, cancel=None, progress=None, captures=AVERAGE_CAPTURES, timer=None,
+                     framing=FRAMING_PLAIN, link_stats=None, calibration=STEADY_CALIBRATION, keep_codes=False):
+    averager = AveragedSpectrum(FS)
+    per_capture = NUM_SAMPLES + PIPELINE_DELAY
+    data = None
+    kept = []
+    for i in range(captures):
+        if i:
+            # 读空上一次采集仍在回送的激励，下一次采集从新的激励开始
+            drain_input(ser)
+        def feed(got, total, volts):
+            # 跳过流水线延迟部分
+            skip = max(PIPELINE_DELAY - (got - len(volts)), 0)
+            averager.update(volts[skip:])
+            if progress is not None:
+                progress(i * per_capture + got, captures * per_capture, volts)
+        data = capture_steady(ser, cancel, feed, timer, framing, link_stats, calibration, keep_codes)
+        if data is None:
+            return None
+        if keep_codes:
+            data, codes = data
+            kept.append(codes)
+        averager.reset_stream()
+    if keep_codes:
+        return data, averager.spectrum(), kept
+    return data, averager.spectrum()
+
+
+# 由多次采集的数据重新计算平均频谱（与capture_averaged中逐块累加的结果相同）
+def averaged_spectrum(captures, fs=FS):
+    averager = AveragedSpectrum(fs)
+    for data in captures:
+        averager.update(data)
+        averager.reset_stream()
+    return averager.spectrum()
+
+
+# 瞬态采集：检测到触发后再采集POST_TRIGGER个点；取消时返回已采集的数据，读超时收不满时引发TimeoutError
+# 返回 (数据, 触发判断用的均值, 数据中的触发点序号)
+def capture_transient(ser, cancel=None, progress=None, timer=None, framing=FRAMING_PLAIN, link_stats=None,
+                      calibration=TRANSIENT_CALIBRATION):
+    t0 = time.perf_counter()
+    stimulus = transient_stimulus()
+    payload = encode_transient_stimulus(stimulus, framing)
+    t1 = time.perf_counter()
+    write_frames(ser, payload, cancel=cancel)
+    t2 = time.perf_counter()
+
+    stop_num = PIPELINE_DELAY + TRANSIENT_SAMPLES
+    data = np.empty(stop_num)
+    got = 0
+    detector = TriggerDetector()
+    decoder = make_decoder(framing)
+    while got < stop_num:
+        if cancel is not None and cancel.cancelled:
+            break
+        codes = read_codes(ser, min(CHUNK_SAMPLES, stop_num - got), decoder)
+        if not codes.size:
+            break
+        volts = codes_to_volts(codes, calibration)
+        trigger = detector.feed(volts)
+        if trigger is not None:
+            # 触发点太靠后时，最多采集到缓冲区末尾（与原来的采集点数上限一致）
+            stop_num = min(trigger + POST_TRIGGER, PIPELINE_DELAY + TRANSIENT_SAMPLES)
+        take = min(len(volts), stop_num - got)
+        data[got:got + take] = volts[:take]
+        got += take
+        if progress is not None:
+            progress(got, stop_num, volts[:take])
+    if got < stop_num and not (cancel is not None and cancel.cancelled):
+        raise TimeoutError(f'读超时: 只收到 {got}/{stop_num} 个点')
+    if timer is not None:
+        record_link(timer, t0, t1, t2, len(stimulus), len(payload), got, decoder.bytes_in)
+    if link_stats is not None:
+        link_stats.add(decoder, TRANSIENT_SKIP, got - TRANSIENT_SKIP)
+    if detector.trigger is not None:
+        trigger_index = detector.trigger - TRANSIENT_SKIP
+    else:
+        trigger_index = stop_num - PIPELINE_DELAY
+    return data[TRANSIENT_SKIP:got], detector.mean, trigger_index
+
+
+# 触发检测：增量维护基线均值（累计均值或指数加权均值），
+# 按块向量化判断 |x - mean| > threshold*|mean|，只记录第一次触发
+class TriggerDetector:
+    def __init__(self, threshold=0.3, skip=TRANSIENT_SKIP, arm_after=PIPELINE_DELAY, alpha=None):
+        self.threshold = threshold
+        self.skip = skip            # 前skip个点不计入均值
+        self.arm_after = arm_after  # 序号大于arm_after的点才判断触发
+        self.alpha = alpha          # None为累计均值，否则为指数加权系数
+        self.reset()
+
+    def reset(self):
+        self.count = 0              # 已输入的点数
+        self.mean = 0.0
+        self.trigger = None         # 触发点的累计序号
+        self.trigger_mean = None
+        self._sum = 0.0
+        self._n = 0
+
+    # 输入一块数据，返回本块中首次触发点的累计序号，未触发返回None
+    def feed(self, volts):
+        volts = np.asarray(volts, dtype=np.float64)
+        n = len(volts)
+        if not n:
+            return None
+        index = self.count + np.arange(n)
+        contrib = index >= self.skip
+        means = np.full(n, self.mean)
+        x = volts[contrib]
+        if x.size:
+            if self.alpha is None:
+                sums = self._sum + np.cumsum(x)
+                m = sums / (self._n + np.arange(1, x.size + 1))
+                self._sum = sums[-1]
+            else:
+                from scipy.signal import lfilter   # scipy.signal导入较慢，用到时再导入
+                prev = self.mean if self._n else x[0]
+                m, _ = lfilter([self.alpha], [1, self.alpha - 1], x, zi=[(1 - self.alpha) * prev])
+            self._n += x.size
+            means[contrib] = m
+            self.mean = m[-1]
+        self.count += n
+
+        if self.trigger is not None:
+            return None
+        hits = np.flatnonzero((index > self.arm_after)
+                              & (np.abs(volts - means) > np.abs(self.threshold * means)))
+        if not hits.size:
+            return None
+        k = int(hits[0])
+        self.trigger = int(index[k])
+        self.trigger_mean = means[k]
+        return self.trigger
+
+
+# 固定容量的环形缓冲区，按累计序号取出数据
+class RingBuffer:
+    def __init__(self, capacity, dtype=np.float64):
+        self.capacity = capacity
+        self.total = 0      # 累计写入的点数
+        self._data = np.zeros(capacity, dtype=dtype)
+
+    def extend(self, values):
+        values = np.asarray(values)
+        n = len(values)
+        skip = max(n - self.capacity, 0)
+        values = values[skip:]
+        pos = (self.total + skip) % self.capacity
+        first = min(len(values), self.capacity - pos)
+        self._data[pos:pos + first] = values[:first]
+        self._data[:len(values) - first] = values[first:]
+        self.total += n
+
+    # 取出累计序号 [start, stop) 的数据（仍在缓冲区内的部分）
+    def window(self, start, stop):
+        start = max(start, self.total - self.capacity, 0)
+        stop = min(stop, self.total)
+        if stop <= start:
+            return np.empty(0, dtype=self._data.dtype)
+        return np.take(self._data, np.arange(start, stop) % self.capacity)
+
+    def latest(self, n):
+        return self.window(self.total - n, self.total)
+
+
+# 连续触发采集：数据持续写入环形缓冲区，内存占用恒定；
+# 触发后再采集post_trigger个点，冻结触发前后的窗口
+# 返回 (窗口数据, 触发时的均值, 窗口内触发点序号或None)；读超时（FPGA不再回送数据）时引发TimeoutError
+def capture_continuous(ser, cancel=None, progress=None, pre_trigger=PRE_TRIGGER,
+                       post_trigger=POST_TRIGGER_WINDOW, capacity=RING_CAPACITY, timer=None,
+                       framing=FRAMING_PLAIN, link_stats=None, calibration=TRANSIENT_CALIBRATION):
+    capacity = max(capacity, pre_trigger + post_trigger + CHUNK_SAMPLES)
+    stimulus = encode_transient_codes(transient_stimulus())
+    ring = RingBuffer(capacity)
+    decoder = make_decoder(framing)
+    sent = 0
+    sent_bytes = 0
+    detector = TriggerDetector()
+    trigger = None
+    timed_out = False
+    t0 = time.perf_counter()
+    while trigger is None or ring.total < trigger + post_trigger:
+        if cancel is not None and cancel.cancelled:
+            break
+        # 激励按CHUNK_SAMPLES分段循环发送，与读取交替进行，保持FPGA持续有激励输入，
+        # 每次发送的时间很短，期间也能及时检查触发和取消
+        while sent - ring.total < 2 * CHUNK_SAMPLES:
+            index = (sent + np.arange(CHUNK_SAMPLES)) % len(stimulus)
+            sent_bytes += write_frames(ser, encode_frames(stimulus[index], framing), cancel=cancel)
+            sent += CHUNK_SAMPLES
+        want = CHUNK_SAMPLES if trigger is None else min(CHUNK_SAMPLES, trigger + post_trigger - ring.total)
+        codes = read_codes(ser, want, decoder)
+        if not codes.size:
+            timed_out = True
+            break
+        volts = codes_to_volts(codes, calibration)
+        if trigger is None:
+            trigger = detector.feed(volts)
+        ring.extend(volts)
+        if progress is not None:
+            progress(ring.total, 0, volts)
+    if timer is not None:
+        # 发送和接收交替进行，整个循环记为一个阶段
+        timer.record('stream', time.perf_counter() - t0, ring.total, decoder.bytes_in + sent_bytes)
+    # 读空仍在回送的激励，不留给下一次采集
+    drain_input(ser)
+    if timed_out:
+        raise TimeoutError(f'读超时: 已接收 {ring.total} 个点后没有数据')
+
+    if trigger is None:
+        window = ring.latest(pre_trigger + post_trigger)
+        start = ring.total - len(window)
+    else:
+        start = max(trigger - pre_trigger, ring.total - ring.capacity, 0)
+        window = ring.window(start, trigger + post_trigger)
+    if link_stats is not None:
+        link_stats.add(decoder, start, len(window))
+    if trigger is None:
+        return window, detector.mean, None
+    return window, detector.trigger_mean, trigger - start
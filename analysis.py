@@ -0,0 +1,296 @@
+from functools import lru_cache
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 计算FFT时至少补零的点数
+FFT_PADDING = 60000
+# 纹波分量个数
+NUM_PEAKS = 5
+# 计算频谱至少需要的点数，更短的数据（如读超时的采集）不做分析
+MIN_SPECTRUM_SAMPLES = 16
+
+
+# 平均频谱每段的点数
+WELCH_SEGMENT = 16384
+# 测量统计每次处理的点数，一块数据留在缓存中完成全部统计
+STATS_CHUNK = 32768
+# 纹波分量之间的最小间隔(Hz)，用于排除同一分量的旁瓣
+MIN_PEAK_SPACING = 50.0
+# 参与间隔和显著性筛选的候选极点数（相对于所需分量个数的倍数）
+CANDIDATE_FACTOR = 8
+
+
+# 一次采集的频谱分析结果（增益为1时计算，改变增益时线性缩放）
+class Spectrum:
+    def __init__(self, freqs, magnitude, top_indices, peak_freqs, peak_values, gain=1):
+        self.freqs = freqs                  # 频率轴
+        self.magnitude = magnitude          # 归一化半边频谱
+        self.top_indices = top_indices      # 纹波分量所在频点
+        self.peak_freqs = peak_freqs        # 插值修正后的纹波频率
+        self.peak_values = peak_values      # 插值修正后的纹波幅值
+        self.gain = gain
+
+    @property
+    def top_frequencies(self):
+        return self.peak_freqs
+
+    @property
+    def top_values(self):
+        return self.peak_values
+
+    # 增益为纯线性缩放，频谱幅值和纹波幅值随之缩放，频点不变
+    def scaled(self, gain):
+        if gain == self.gain:
+            return self
+        k = gain / self.gain
+        return Spectrum(self.freqs, self.magnitude * k, self.top_indices, self.peak_freqs,
+                        self.peak_values * k, gain)
+
+
+# 找出幅值最大的count个极点，返回 (频点序号, 插值后的频点位置, 插值后的幅值)
+# min_distance: 极点之间的最小间隔(频点数)；prominence: 极点相对两侧的最小显著性
+# interpolation: 'parabolic' 抛物线插值, 'gaussian' 对数幅值抛物线插值, None 不插值
+def pick_peaks(magnitude, count=NUM_PEAKS, min_distance=1, prominence=0.0,
+               interpolation='parabolic'):
+    m = np.asarray(magnitude)
+    # 一次向量化找出全部局部极大值（不含直流和端点）
+    peaks = np.flatnonzero((m[1:-1] > m[:-2]) & (m[1:-1] >= m[2:])) + 1
+    # 只保留最大的若干候选，再做显著性和间隔筛选
+    keep = min(len(peaks), count * CANDIDATE_FACTOR)
+    if keep < len(peaks):
+        peaks = peaks[np.argpartition(m[peaks], -keep)[-keep:]]
+    peaks = peaks[np.argsort(m[peaks])[::-1]]
+    if prominence > 0 and len(peaks):
+        from scipy.signal import peak_prominences   # scipy.signal导入较慢，用到时再导入
+        wlen = 2 * max(min_distance, 1) + 1
+        peaks = peaks[peak_prominences(m, peaks, wlen=wlen)[0] >= prominence]
+    selected = []
+    for p in peaks:
+        if len(selected) == count:
+            break
+        if all(abs(p - q) >= min_distance for q in selected):
+            selected.append(p)
+    selected = np.asarray(selected, dtype=int)
+
+    a, b, c = m[selected - 1], m[selected], m[selected + 1]
+    offset = np.zeros(len(selected))
+    values = b.astype(np.float64)
+    if interpolation == 'gaussian':
+        tiny = np.finfo(np.float64).tiny
+        a, b, c = np.log(np.maximum(a, tiny)), np.log(np.maximum(b, tiny)), np.log(np.maximum(c, tiny))
+    if interpolation is not None and len(selected):
+        denom = a - 2 * b + c
+        safe = denom != 0
+        offset[safe] = 0.5 * (a - c)[safe] / denom[safe]
+        peak = b - 0.25 * (a - c) * offset
+        values = np.exp(peak) if interpolation == 'gaussian' else peak
+    return selected, selected + offset, values
+
+
+# 频率轴按 (N, Fs) 缓存
+@lru_cache(maxsize=16)
+def frequency_axis(N, fs):
+    half_fx = np.fft.rfftfreq(N, 1 / fs)[:N // 2]
+    half_fx.flags.writeable = False
+    return half_fx
+
+
+# 窗函数按 (名称, 点数) 缓存，None为矩形窗
+@lru_cache(maxsize=16)
+def window_function(window, n):
+    if window is None:
+        w = np.ones(n)
+    else:
+        from scipy.signal import get_window
+        w = get_window(window, n)
+    w.flags.writeable = False
+    return w
+
+
+# 补零后的FFT长度：至少补padding个零，并取实数FFT的快速长度
+def padded_length(n, padding=FFT_PADDING):
+    from scipy.fft import next_fast_len
+    return next_fast_len(n + padding, real=True)
+
+
+# 计算去直流、补零后的归一化半边频谱，并找出纹波分量
+def analyze_spectrum(data, fs, window=None, padding=FFT_PADDING, prominence=0.0,
+                     interpolation='parabolic'):
+    data = np.asarray(data, dtype=np.float64)
+    n = len(data)
+    if n < MIN_SPECTRUM_SAMPLES:
+        raise ValueError(f'数据太短，无法计算频谱: {n} 点')
+    if not np.isfinite(data).all():
+        raise ValueError('数据中有无效值，无法计算频谱')
+    w = window_function(window, n)
+    x = (data - np.mean(data)) * w   #去直流分量，加窗
+    N = padded_length(n, padding)
+    from scipy.fft import rfft   # 首次计算频谱时才导入scipy
+    fft_data = rfft(x, n=N)   # 实数FFT，rfft内部补零
+    # 幅值归一化：直流分量除以窗口和，其余分量乘2
+    normalization_half_data = np.abs(fft_data[:N // 2]) / w.sum()
+    normalization_half_data[1:] *= 2
+    half_fx = frequency_axis(N, fs)
+
+    # 找出纹波分量，并插值得到比频点间隔更细的频率
+    df = half_fx[1] - half_fx[0]
+    top_indices, positions, values = pick_peaks(
+        normalization_half_data, min_distance=max(int(MIN_PEAK_SPACING / df), 1),
+        prominence=prominence, interpolation=interpolation)
+    return Spectrum(half_fx, normalization_half_data, top_indices, positions * df, values)
+
+
+# 平均频谱（Welch法）：把数据切成有重叠的加窗分段，功率谱逐段累加平均；
+# 数据可分多次输入（流式或多次采集），分段不跨越 reset_stream() 的边界
+class AveragedSpectrum:
+    def __init__(self, fs, segment=WELCH_SEGMENT, overlap=0.5, window='hann', padding=None,
+                 prominence=0.0, interpolation='gaussian'):
+        self.fs = fs
+        self.segment = segment
+        self.hop = max(int(segment * (1 - overlap)), 1)
+        self.window = window_function(window, segment)
+        self.N = padded_length(segment, segment if padding is None else padding)
+        self.prominence = prominence
+        self.interpolation = interpolation
+        self.reset()
+
+    def reset(self):
+        self.segments = 0
+        self._power = np.zeros(self.N // 2)
+        self._tail = np.empty(0)
+
+    # 丢弃未成段的数据，下一次输入作为新的连续数据段
+    def reset_stream(self):
+        self._tail = np.empty(0)
+
+    # 输入新数据，处理其中所有完整的分段，返回新增的分段数
+    def update(self, data):
+        x = np.concatenate([self._tail, np.asarray(data, dtype=np.float64)])
+        if len(x) < self.segment:
+            self._tail = x
+            return 0
+        frames = sliding_window_view(x, self.segment)[::self.hop]
+        frames = (frames - frames.mean(axis=1, keepdims=True)) * self.window   #去直流分量，加窗
+        from scipy.fft import rfft
+        spectra = rfft(frames, n=self.N, axis=1)[:, :self.N // 2]
+        self._power += np.sum(spectra.real ** 2 + spectra.imag ** 2, axis=0)
+        self.segments += len(frames)
+        self._tail = x[len(frames) * self.hop:]
+        return len(frames)
+
+    # 当前的平均频谱及纹波分量
+    def spectrum(self):
+        if not self.segments:
+            raise ValueError(f'数据太短，无法计算平均频谱: 不足 {self.segment} 点')
+        magnitude = np.sqrt(self._power / max(self.segments, 1)) / self.window.sum()
+        magnitude[1:] *= 2
+        half_fx = frequency_axis(self.N, self.fs)
+        df = half_fx[1] - half_fx[0]
+        top_indices, positions, values = pick_peaks(
+            magnitude, min_distance=max(int(MIN_PEAK_SPACING / df), 1),
+            prominence=self.prominence, interpolation=self.interpolation)
+        return Spectrum(half_fx, magnitude, top_indices, positions * df, values)
+
+
+# 测量统计：波峰值、波谷值、平均值、纹波有效值（交流分量的有效值，即标准差）、信号功率和噪声功率
+# 按块处理，每块在缓存中完成最大值、最小值、均值和偏差平方和，再按Welford/Chan公式合并，
+# 数值上与两遍计算一致；可以多次update，用于长时间或连续采集时不保存全部数据的实时统计
+class SignalStats:
+    def __init__(self, data=None):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0               # 偏差平方和
+        self.peak = -np.inf
+        self.trough = np.inf
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        data = np.asarray(data, dtype=np.float64).reshape(-1)
+        for start in range(0, len(data), STATS_CHUNK):
+            x = data[start:start + STATS_CHUNK]
+            n = len(x)
+            mean = x.sum() / n
+            d = x - mean
+            self._merge(n, mean, float(d @ d), x.max(), x.min())
+        return self
+
+    # 合并另一组统计（如另一段数据或另一个线程的结果）
+    def merge(self, other):
+        if other.count:
+            self._merge(other.count, other.mean, other.m2, other.peak, other.trough)
+        return self
+
+    def _merge(self, n, mean, m2, peak, trough):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        self.peak = max(self.peak, float(peak))
+        self.trough = min(self.trough, float(trough))
+
+    # 噪声功率：去掉直流后的均方值
+    @property
+    def noise_power(self):
+        return self.m2 / self.count if self.count else float('nan')
+
+    # 信号功率：均方值
+    @property
+    def signal_power(self):
+        return self.noise_power + self.mean * self.mean
+
+    @property
+    def rms(self):
+        return float(np.sqrt(self.noise_power))
+
+    @property
+    def snr(self):
+        return float(10 * np.log10(self.signal_power / self.noise_power))
+
+
+# 稳态波形的测量值：波峰值、波谷值、纹波有效值、平均值、信噪比和纹波分量
+def signal_metrics(data, spectrum):
+    stats = SignalStats(data)
+    return {
+        'peak_voltage': stats.peak,
+        'trough_voltage': stats.trough,
+        'rms_voltage': stats.rms,
+        'mean_voltage': stats.mean,
+        'snr': stats.snr,
+        'ripple_frequencies': np.asarray(spectrum.top_frequencies).tolist(),
+        'ripple_amplitudes': np.asarray(spectrum.top_values).tolist()
+    }
+
+
+# 显示用降采样：把 data[start:stop] 按像素分桶，每桶保留最小值和最大值（按出现顺序），
+# 峰值不会因抽点而丢失；返回 (横坐标序号, 数值)
+def minmax_envelope(data, start, stop, bins):
+    start = max(start, 0)
+    seg = np.asarray(data[start:stop])
+    n = len(seg)
+    bins = max(int(bins), 1)
+    if n <= 2 * bins:
+        return np.arange(start, start + n), seg
+    per = -(-n // bins)
+    k = n // per
+    blocks = seg[:k * per].reshape(k, per)
+    amin = blocks.argmin(axis=1)
+    amax = blocks.argmax(axis=1)
+    rows = np.arange(k)
+    base = start + rows * per
+    min_first = amin <= amax
+    first = np.where(min_first, amin, amax)
+    second = np.where(min_first, amax, amin)
+    x = np.empty(2 * k, dtype=np.int64)
+    y = np.empty(2 * k, dtype=seg.dtype)
+    x[0::2] = base + first
+    x[1::2] = base + second
+    y[0::2] = blocks[rows, first]
+    y[1::2] = blocks[rows, second]
+    # 不足一桶的尾部原样保留
+    tail = seg[k * per:]
+    if len(tail):
+        x = np.concatenate([x, start + k * per + np.arange(len(tail))])
+        y = np.concatenate([y, tail])
+    return x, y
@@ -0,0 +1,88 @@
+import argparse
+import json
+import sys
+from acquisition import capture_steady, capture_averaged, FS
+from analysis import analyze_spectrum, signal_metrics
+from calibration import select_profile
+from device_store import DeviceStore, record_measurement, DEVICES_DB
+from fpga_link import SerialSession, DEFAULT_PORT, DEFAULT_BAUDRATE, DEFAULT_TIMEOUT, FRAMING_PLAIN, FRAMINGS
+from waveform_archive import save_waveform, SAMPLE_FORMATS
+
+# 与界面增益按钮对应的增益值
+GAINS = {
+    '1': 1,
+    '2': (5.1+5.1)/5.1,
+    '2.961': (10+5.1)/5.1,
+    '3.941': (5.1+15)/5.1,
+    '10.216': (5.1+47)/5.1,
+    '20.608': (5.1+100)/5.1,
+    '40.216': (5.1+200)/5.1,
+}
+
+
+# 无界面采集：采集一次稳态波形，计算测量值并写入设备数据库
+# 按设备和增益选择修正参数；archive: 可选，把采集到的波形保存为二进制波形文件
+# 链路丢块补点的采集引发ValueError，不保存测量结果
+def measure(session, device, mode, gain=1, captures=1, store=DEVICES_DB, archive=None,
+            archive_format='float32'):
+    devices = DeviceStore(store) if device is not None else None
+    try:
+        calibration = select_profile(devices.get(device) if devices else None, 'steady', gain)
+        options = {'framing': session.framing, 'link_stats': session.link_stats, 'calibration': calibration}
+        if captures > 1:
+            data, spectrum = session.run(capture_averaged, captures=captures, **options)
+        else:
+            data = session.run(capture_steady, **options)
+            spectrum = analyze_spectrum(data, FS)
+        if session.link_stats.filled:
+            # 丢块处重复上一个码值补点，会使纹波幅值和统计值偏小
+            raise ValueError(f'采集中有 {session.link_stats.filled} 个链路丢块的补点，不能用于测量')
+        metrics = signal_metrics(data * gain, spectrum.scaled(gain))
+        if archive is not None:
+            save_waveform(archive, data, device, 'steady', FS, gain, calibration, archive_format)
+        if devices is not None:
+            devices.update(device, lambda record: record_measurement(record, mode, metrics))
+    finally:
+        if devices is not None:
+            devices.close()
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='无界面采集与测量')
+    parser.add_argument('--port', default=DEFAULT_PORT, help='串口名')
+    parser.add_argument('--baudrate', type=int, default=DEFAULT_BAUDRATE, help='波特率')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='读超时(s)')
+    parser.add_argument('--framing', choices=FRAMINGS, default=FRAMING_PLAIN, help='链路帧格式')
+    parser.add_argument('--device', default=None, help='设备名称，不指定时只输出测量结果')
+    parser.add_argument('--mode', choices=['unloaded', 'loaded', 'min_max_voltage'], default='unloaded',
+                        help='测量类型：空载、满载、电压调节范围')
+    parser.add_argument('--gain', choices=list(GAINS), default='1', help='信号增益')
+    parser.add_argument('--average', type=int, default=1, help='平均频谱的采集次数')
+    parser.add_argument('--store', default=DEVICES_DB, help='设备信息数据库')
+    parser.add_argument('--archive', default=None, help='把波形保存为二进制波形文件')
+    parser.add_argument('--archive-format', choices=list(SAMPLE_FORMATS), default='float32',
+                        help='波形文件的样本格式：float32电压或int16码值')
+    args = parser.parse_args(argv)
+
+    session = SerialSession(args.port, args.baudrate, args.timeout, verbose=False, framing=args.framing)
+    try:
+        metrics = measure(session, args.device, args.mode, GAINS[args.gain], args.average, args.store,
+                          args.archive, args.archive_format)
+    except (OSError, ValueError) as e:
+        # 读超时等采集失败时不保存测量结果
+        print(json.dumps({'error': str(e)}, ensure_ascii=False), file=sys.stderr)
+        return 1
+    finally:
+        session.close()
+    json.dump({'device': args.device, 'mode': args.mode, **metrics}, sys.stdout, ensure_ascii=False)
+    print()
+    # 链路错误统计输出到标准错误，不影响JSON结果
+    if session.link_stats.errors:
+        print(json.dumps({'link': session.link_stats.total, 'damaged': session.link_stats.damaged}),
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
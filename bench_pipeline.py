@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from acquisition import FS, steady_stimulus
+from analysis import analyze_spectrum, signal_metrics, minmax_envelope
+from csv_import import read_capture_csv, write_capture_csv
+from fpga_link import (encode_steady_stimulus, volts_to_adc_codes, codes_to_volts, pack_codes, frame_blocks,
+                       StreamDecoder, PackedDecoder, BlockDecoder, READ_CHUNK, FRAMING_PACKED, FRAMING_BLOCKS)
+from waveform_archive import save_waveform
+
+# 默认测试的采集点数
+BENCH_SIZES = [8192, 60000, 240000]
+# 每个阶段重复的次数（取最小值和中位数）
+BENCH_REPEAT = 7
+# 信号源数据文件，作为真实数据的测试用例
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), '信号源数据.csv')
+# 与界面增益按钮相同的增益，用于增益阶段
+BENCH_GAIN = (5.1+47)/5.1
+
+
+# 合成测试数据：与稳态激励相同的纹波分量加白噪声，量化到12位码值
+def synthetic_signal(n, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / FS
+    volts = 1.5 + 0.3*np.sin(2*np.pi*125*t) + 0.1*np.sin(2*np.pi*1200*t) \
+        + 0.1*np.sin(2*np.pi*3005*t) + 0.05*np.sin(2*np.pi*5000*t) + rng.normal(0, 0.03, n)
+    return codes_to_volts(volts_to_adc_codes(volts))
+
+
+# 计时：先运行一次预热，再重复repeat次，返回每次的耗时(s)
+def timeit(func, repeat):
+    func()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+# 界面绘图用的画布（Agg后端，不需要显示器），尺寸与主窗口的波形图相近
+def make_canvas():
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figure = Figure(figsize=(10, 6))
+    canvas = FigureCanvasAgg(figure)
+    ax1, ax2 = figure.subplots(2, 1)
+    signal_line, = ax1.plot([], [], color='r')
+    fft_line, = ax2.plot([], [], color='b')
+    return canvas, ax1, ax2, signal_line, fft_line
+
+
+# 按界面流程的各个阶段计时；data为增益前的电压
+def bench_fixture(name, data, repeat, tmpdir):
+    n = len(data)
+    stimulus = np.resize(steady_stimulus(), n)
+    payload = volts_to_adc_codes(data).astype('>u2').tobytes()
+    packed = pack_codes(volts_to_adc_codes(data))
+    blocks = frame_blocks(volts_to_adc_codes(data))
+    spectrum = analyze_spectrum(data, FS)
+    gained = data * BENCH_GAIN
+    canvas, ax1, ax2, signal_line, fft_line = make_canvas()
+    csv_path = os.path.join(tmpdir, f'{name}.csv')
+    fpw_path = os.path.join(tmpdir, f'{name}.fpw')
+    write_capture_csv(csv_path, gained, name)
+
+    def decode(decoder, raw):
+        decoder.reset()
+        for i in range(0, len(raw), READ_CHUNK):
+            codes_to_volts(decoder.feed(raw[i:i + READ_CHUNK]))
+
+    def gain():
+        return data * BENCH_GAIN, spectrum.scaled(BENCH_GAIN)
+
+    def plot_signal():
+        x, y = minmax_envelope(gained, 0, n, ax1.bbox.width)
+        signal_line.set_data(x, y)
+        ax1.set_xlim(0, n)
+        ax1.set_ylim(np.min(gained), np.max(gained))
+        canvas.draw()
+
+    def plot_fft():
+        visible = spectrum.freqs <= 5000
+        fft_line.set_data(spectrum.freqs[visible], spectrum.magnitude[visible])
+        ax2.set_xlim(0, 5000)
+        canvas.draw()
+
+    stages = {
+        'encode': (lambda: encode_steady_stimulus(stimulus), len(stimulus) * 2),
+        'encode_packed': (lambda: encode_steady_stimulus(stimulus, FRAMING_PACKED), len(packed)),
+        'decode': (lambda: decode(StreamDecoder(), payload), len(payload)),
+        'decode_packed': (lambda: decode(PackedDecoder(), packed), len(packed)),
+        'encode_blocks': (lambda: encode_steady_stimulus(stimulus, FRAMING_BLOCKS), len(blocks)),
+        'decode_blocks': (lambda: decode(BlockDecoder(), blocks), len(blocks)),
+        'gain': (gain, data.nbytes),
+        'fft_peaks': (lambda: analyze_spectrum(data, FS), data.nbytes),
+        'stats': (lambda: signal_metrics(gained, spectrum), data.nbytes),
+        'plot_signal': (plot_signal, data.nbytes),
+        'plot_fft': (plot_fft, data.nbytes),
+        'csv_export': (lambda: write_capture_csv(csv_path, gained, name), None),
+        'csv_import': (lambda: read_capture_csv(csv_path), None),
+        'binary_export': (lambda: save_waveform(fpw_path, data, name), None),
+    }
+    results = []
+    for stage, (func, nbytes) in stages.items():
+        times = timeit(func, repeat)
+        if nbytes is None:
+            nbytes = os.path.getsize(csv_path if stage.startswith('csv') else fpw_path)
+        best = min(times)
+        results.append({
+            'stage': stage,
+            'fixture': name,
+            'samples': n,
+            'bytes': nbytes,
+            'repeat': repeat,
+            'min_ms': best * 1000,
+            'median_ms': float(np.median(times)) * 1000,
+            'msamples_per_s': n / best / 1e6,
+            'mbytes_per_s': nbytes / best / 1e6,
+        })
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# 与之前保存的结果比较，输出每个阶段耗时的比值（>1 为变慢）
+def compare(results, baseline):
+    old = {(r['stage'], r['fixture']): r for r in baseline['results']}
+    for r in results:
+        prev = old.get((r['stage'], r['fixture']))
+        if prev is None:
+            continue
+        ratio = r['min_ms'] / prev['min_ms'] if prev['min_ms'] else float('inf')
+        flag = '  <-- 变慢' if ratio > 1.1 else ''
+        print(f"{r['fixture']:>12} {r['stage']:>14} {prev['min_ms']:10.3f} -> {r['min_ms']:10.3f} ms"
+              f"  x{ratio:.2f}{flag}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='采集与分析流程各阶段的性能测试，结果输出为JSON')
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCH_SIZES, help='合成数据的点数')
+    parser.add_argument('--repeat', type=int, default=BENCH_REPEAT, help='每个阶段重复的次数')
+    parser.add_argument('--no-sample', action='store_true', help='不使用信号源数据.csv')
+    parser.add_argument('--output', default=None, help='结果JSON文件，默认输出到标准输出')
+    parser.add_argument('--compare', default=None, help='与之前保存的结果JSON比较')
+    args = parser.parse_args(argv)
+
+    fixtures = [(f'synthetic_{n}', synthetic_signal(n)) for n in args.sizes]
+    if not args.no_sample and os.path.exists(SAMPLE_CSV):
+        fixtures.append(('sample_csv', read_capture_csv(SAMPLE_CSV)[1]))
+
+    import matplotlib
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, data in fixtures:
+            results += bench_fixture(name, data, args.repeat, tmpdir)
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
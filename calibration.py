@@ -0,0 +1,119 @@
+import argparse
+import csv
+import json
+import sys
+import numpy as np
+from device_store import DeviceStore, DEVICES_DB
+from fpga_link import (adc_nominal_volts, calibration_json, calibration_table, STEADY_CALIBRATION,
+                       TRANSIENT_CALIBRATION)
+
+# 设备没有保存修正参数时使用的默认参数
+DEFAULT_PROFILES = {
+    'steady': STEADY_CALIBRATION,
+    'transient': TRANSIENT_CALIBRATION,
+}
+# 采集模式 -> 修正参数的模式（平均频谱与稳态、连续触发与瞬态使用相同的参数）
+PROFILE_MODES = {
+    'steady': 'steady',
+    'averaged': 'steady',
+    'transient': 'transient',
+    'continuous': 'transient',
+}
+# 设备记录中保存修正参数的键：{'steady': {增益: 参数, ...}, 'transient': {...}}
+CALIBRATION_KEY = 'calibration'
+# 适用于所有增益的参数
+ANY_GAIN = '*'
+
+
+# 增益 -> 保存时使用的键，与analyzer_cli的增益选项一致，如 '1'、'10.216'
+def gain_key(gain):
+    if gain == ANY_GAIN:
+        return ANY_GAIN
+    return f'{float(gain):.3f}'.rstrip('0').rstrip('.')
+
+
+# 按设备、模式和增益选择修正参数：先找该增益的参数，再找适用于所有增益的参数，都没有时使用默认参数
+def select_profile(record, mode, gain=1):
+    mode = PROFILE_MODES.get(mode, mode)
+    profiles = ((record or {}).get(CALIBRATION_KEY) or {}).get(mode) or {}
+    profile = profiles.get(gain_key(gain)) or profiles.get(ANY_GAIN)
+    return profile if profile is not None else DEFAULT_PROFILES[mode]
+
+
+# 把修正参数写入设备记录（与DeviceStore.update一起使用）；profile为None时删除
+def set_profile(record, mode, gain, profile):
+    mode = PROFILE_MODES.get(mode, mode)
+    profiles = record.setdefault(CALIBRATION_KEY, {}).setdefault(mode, {})
+    if profile is None:
+        profiles.pop(gain_key(gain), None)
+    else:
+        calibration_table(profile)      # 先编译一次，参数不合法时不保存
+        profiles[gain_key(gain)] = profile
+    return record
+
+
+# 由参考测量 (码值, 实际电压) 拟合线性修正参数 (v + 偏移) * 比例
+def fit_profile(codes, volts):
+    nominal = adc_nominal_volts(codes)
+    volts = np.asarray(volts, dtype=np.float64)
+    if len(volts) < 2 or np.ptp(nominal) == 0:
+        raise ValueError('拟合至少需要两个不同码值的参考点')
+    scale, intercept = np.polyfit(nominal, volts, 1)
+    return {'offset': float(intercept / scale), 'scale': float(scale)}
+
+
+# 读取参考测量文件：每行 码值,电压，忽略无法解析的行（如表头）
+def read_points(path):
+    points = []
+    with open(path, newline='') as file:
+        for row in csv.reader(file):
+            try:
+                points.append([int(row[0]), float(row[1])])
+            except (ValueError, IndexError):
+                continue
+    return points
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='设备修正参数：按设备、模式和增益保存在设备数据库中')
+    parser.add_argument('device', help='设备名称')
+    parser.add_argument('--mode', choices=list(DEFAULT_PROFILES), default='steady', help='采集模式')
+    parser.add_argument('--gain', default='1', help=f'增益，{ANY_GAIN} 表示所有增益')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--linear', type=float, nargs=2, metavar=('OFFSET', 'SCALE'),
+                       help='线性修正 (v + OFFSET) * SCALE')
+    group.add_argument('--fit', metavar='CSV', help='由参考测量(码值,电压)拟合线性修正')
+    group.add_argument('--points', metavar='CSV', help='由参考测量(码值,电压)分段线性修正')
+    group.add_argument('--delete', action='store_true', help='删除该增益的参数，恢复默认')
+    parser.add_argument('--store', default=DEVICES_DB, help='设备信息数据库')
+    args = parser.parse_args(argv)
+
+    gain = args.gain if args.gain == ANY_GAIN else float(args.gain)
+    if args.linear:
+        profile = {'offset': args.linear[0], 'scale': args.linear[1]}
+    elif args.fit:
+        points = np.array(read_points(args.fit))
+        profile = fit_profile(points[:, 0].astype(int), points[:, 1])
+    elif args.points:
+        profile = {'points': read_points(args.points)}
+    else:
+        profile = None
+
+    devices = DeviceStore(args.store)
+    try:
+        if profile is not None or args.delete:
+            record = devices.update(args.device, lambda record: set_profile(record, args.mode, gain, profile))
+        else:
+            record = devices.get(args.device)
+    finally:
+        devices.close()
+    selected = select_profile(record, args.mode, 1 if gain == ANY_GAIN else gain)
+    json.dump({'device': args.device, 'mode': args.mode, 'gain': gain_key(gain),
+               'calibration': calibration_json(selected),
+               'saved': (record or {}).get(CALIBRATION_KEY, {})}, sys.stdout, ensure_ascii=False)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
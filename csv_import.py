@@ -0,0 +1,224 @@
+import argparse
+import csv
+import io
+import json
+import os
+import warnings
+import numpy as np
+from acquisition import FS
+from analysis import analyze_spectrum, signal_metrics, SignalStats
+from waveform_archive import load_waveform, waveform_volts, WAVEFORM_SUFFIX
+
+# 每次读取并解析的字节数
+CSV_CHUNK_BYTES = 1 << 20
+# 导出CSV中测量结果各列对应的字段
+MODE_FIELDS = ['peak_voltage', 'trough_voltage', 'rms_voltage', 'mean_voltage', 'snr']
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _numbers(text):
+    return [float(x) for x in text.split(',') if x.strip()]
+
+
+# 解析导出CSV的文件头（设备、空载/满载测量结果、电压调节范围、负载调整率），
+# 返回与设备记录相同结构的字典
+def parse_csv_header(lines):
+    header = {'kind': None, 'device': None, 'unloaded': {}, 'loaded': {}}
+    section = None
+    for row in csv.reader(lines):
+        if not row or not row[0].strip():
+            continue
+        first = row[0].strip()
+        if first == 'Stable Signal Data':
+            header['kind'] = 'steady'
+        elif first == 'Transient Signal Data':
+            header['kind'] = 'transient'
+        elif first in ('Device', 'Mode', 'Min(v)', 'Voltage Adjustment Rate(%)'):
+            section = first
+            if first == 'Mode' and header['kind'] is None:
+                header['kind'] = 'steady'
+        elif first.endswith('dataset:'):
+            section = None
+        elif section == 'Device':
+            header['device'] = row[0]
+            section = None
+        elif section == 'Mode' and first in ('Unloaded', 'Loaded') and len(row) >= 8:
+            record = {key: _number(value) for key, value in zip(MODE_FIELDS, row[1:6])}
+            record['ripple_frequencies'] = _numbers(row[6])
+            record['ripple_amplitudes'] = _numbers(row[7])
+            header[first.lower()] = record
+        elif section == 'Min(v)' and len(row) >= 3:
+            min_voltage, max_voltage, voltage_range = (_number(x) for x in row[:3])
+            header['min_max_range'] = {'min_voltage': min_voltage, 'max_voltage': max_voltage,
+                                       'voltage_range': voltage_range}
+        elif section == 'Voltage Adjustment Rate(%)':
+            header['carculation_results'] = {'voltage_adjustment_rate': _number(row[0])}
+    if header['kind'] is None:
+        header['kind'] = 'steady'
+    return header
+
+
+# 把若干行 "index,value" 解析为 (序号, 数值) 数组，不逐行构造Python对象；
+# 每行必须正好两列且都能解析，否则引发ValueError
+def _parse_rows(block):
+    if not block.strip():
+        return np.empty(0), np.empty(0)
+    rows = block.count(b'\n') + (not block.endswith(b'\n'))
+    if block.count(b',') != rows:
+        raise ValueError('波形数据列数不正确')
+    with warnings.catch_warnings():
+        # fromstring遇到无法解析的文本时只给出警告并在该处停止，按错误处理
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            values = np.fromstring(block.replace(b'\n', b',').decode('ascii'), sep=',')
+        except (ValueError, DeprecationWarning):
+            values = None
+    if values is None or len(values) != 2 * rows:
+        raise ValueError('波形数据中有无法解析的行')
+    values = values.reshape(-1, 2)
+    return values[:, 0], values[:, 1]
+
+
+# 读取导出的CSV：先解析文件头，再分块把 index,value/V 表读入NumPy数组
+# 返回 (文件头, 电压数组)
+def read_capture_csv(path, chunk_bytes=CSV_CHUNK_BYTES):
+    with open(path, 'rb') as file:
+        lines = []
+        for line in file:
+            if line.strip().lower().startswith(b'index,'):
+                break
+            lines.append(line.decode('utf-8-sig'))
+        else:
+            raise ValueError(f'没有找到波形数据表: {path}')
+        header = parse_csv_header(io.StringIO(''.join(lines)))
+
+        chunks = []
+        expected = 0
+        tail = b''
+        while True:
+            block = file.read(chunk_bytes)
+            if not block:
+                rows, tail = tail, b''
+            else:
+                block = tail + block
+                cut = block.rfind(b'\n') + 1
+                rows, tail = block[:cut], block[cut:]
+            index, values = _parse_rows(rows)
+            if len(index):
+                # 序号必须连续，否则说明文件损坏
+                if index[0] != expected or index[-1] != expected + len(index) - 1:
+                    raise ValueError(f'波形数据序号不连续: {path}')
+                expected += len(index)
+                chunks.append(values)
+            if not block:
+                break
+    data = np.concatenate(chunks) if chunks else np.empty(0)
+    header['count'] = len(data)
+    return header, data
+
+
+# 测量结果一行：模式, 波峰值, 波谷值, 有效值, 平均值, 信噪比, 纹波频率, 纹波幅值
+def _mode_row(name, record):
+    return [name] + [record.get(key, '') for key in MODE_FIELDS] + [
+        ', '.join([f"{freq:.0f}" for freq in record.get('ripple_frequencies', [])]),
+        ', '.join([f"{amp:.2f}" for amp in record.get('ripple_amplitudes', [])])
+    ]
+
+
+# 导出CSV：稳态波形写入设备的测量结果，瞬态波形只写设备名称，之后是 index,value/V 波形表
+def write_capture_csv(path, data, device, record=None, kind='steady'):
+    record = record or {}
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        if kind == 'transient':
+            writer.writerow(['Transient Signal Data'])
+        # 写入设备名称
+        writer.writerow(['Device'])
+        writer.writerow([device])
+        if kind != 'transient':
+            # 写入表头
+            writer.writerow(['Mode', 'Peak Voltage (V)', 'Trough Voltage (V)', 'RMS Voltage (V)'
+                             , 'Mean Voltage (V)', 'SNR (dB)', 'Ripple Frequencies (Hz)'
+                             , 'Ripple Amplitudes (V)'])
+            # 写入空载和满载数据
+            unloaded = record.get('unloaded', {})
+            loaded = record.get('loaded', {})
+            if unloaded:
+                writer.writerow(_mode_row('Unloaded', unloaded))
+            if loaded:
+                writer.writerow(_mode_row('Loaded', loaded))
+            writer.writerow(['Min(v)','Max(v)','Min-Max Voltage Range(v)'])
+            min_max_range = record.get('min_max_range', {})
+            if min_max_range:
+                writer.writerow([
+                    min_max_range.get('min_voltage', ''),
+                    min_max_range.get('max_voltage', ''),
+                    min_max_range.get('voltage_range', '')
+                ])
+            writer.writerow(['Voltage Adjustment Rate(%)'])
+            info = record.get('carculation_results', {})
+            if info:
+                writer.writerow([
+                    info.get('voltage_adjustment_rate', '')
+                ])
+
+        # 写入波形数据
+        writer.writerow(['\n dataset:'])
+        writer.writerow(['index','value/V'])
+        for idx, val in enumerate(data):
+            writer.writerow([idx,val])
+
+
+# 读取波形文件（.fpw 或导出的CSV），返回 (文件头, 增益前的电压数组)；
+# CSV中保存的是显示的数据，增益记为1
+def load_capture(path):
+    if path.lower().endswith(WAVEFORM_SUFFIX):
+        header, samples = load_waveform(path)
+        return dict(header, kind=header['mode']), waveform_volts(header, samples)
+    header, data = read_capture_csv(path)
+    header['gain'] = 1
+    return header, data
+
+
+# 离线重新分析：稳态波形与在线采集相同的频谱和测量计算，瞬态波形只计算峰谷值和均值
+# 返回 (文件头, 数据, 频谱或None, 测量值)
+def reanalyze(path, fs=FS):
+    header, data = load_capture(path)
+    gain = header['gain']
+    if header['kind'] == 'transient':
+        data = data * gain
+        stats = SignalStats(data)
+        metrics = {'peak_voltage': stats.peak, 'trough_voltage': stats.trough, 'mean_voltage': stats.mean}
+        return header, data, None, metrics
+    spectrum = analyze_spectrum(data, header.get('fs', fs)).scaled(gain)
+    data = data * gain
+    return header, data, spectrum, signal_metrics(data, spectrum)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='离线重新分析导出的波形文件，每个文件输出一行JSON')
+    parser.add_argument('paths', nargs='+', help='CSV或.fpw文件，或包含它们的目录')
+    parser.add_argument('--fs', type=float, default=FS, help='CSV文件的采样率(Hz)')
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            paths.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith(('.csv', WAVEFORM_SUFFIX))))
+        else:
+            paths.append(path)
+    for path in paths:
+        try:
+            header, data, spectrum, metrics = reanalyze(path, args.fs)
+        except (OSError, ValueError) as e:
+            print(json.dumps({'path': path, 'error': str(e)}, ensure_ascii=False), flush=True)
+            continue
+        print(json.dumps({'path': path, 'device': header['device'], 'kind': header['kind'],
+                          'count': len(data), **metrics}, ensure_ascii=False), flush=True)
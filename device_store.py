@@ -0,0 +1,113 @@
+import json
+import os
+import sqlite3
+import time
+
+# 旧版设备信息文件（JSON），首次运行时导入数据库
+DEVICES_FILE = 'devices.json'
+# 设备信息数据库
+DEVICES_DB = 'devices.db'
+# 数据库结构版本
+SCHEMA_VERSION = 1
+
+
+# 加载设备文件，文件不存在时返回空字典
+def load_devices(path=DEVICES_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+# 设备信息存储：SQLite(WAL)，每个设备一行，按设备读取和更新，
+# 写入在事务中完成，中途崩溃不会损坏其他设备的数据
+class DeviceStore:
+    def __init__(self, path=DEVICES_DB, legacy_path=DEVICES_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=10)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < SCHEMA_VERSION:
+            with self.conn:
+                self.conn.execute('CREATE TABLE IF NOT EXISTS devices ('
+                                  'name TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)')
+                # 首次运行时导入旧的devices.json
+                if legacy_path is not None:
+                    now = time.time()
+                    self.conn.executemany(
+                        'INSERT OR IGNORE INTO devices (name, data, updated) VALUES (?, ?, ?)',
+                        [(name, json.dumps(record), now)
+                         for name, record in load_devices(legacy_path).items()])
+                self.conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+
+    # 所有设备名称（按添加顺序）
+    def names(self):
+        return [row[0] for row in self.conn.execute('SELECT name FROM devices ORDER BY rowid')]
+
+    def __contains__(self, name):
+        return self.conn.execute('SELECT 1 FROM devices WHERE name = ?', (name,)).fetchone() is not None
+
+    # 读取单个设备的记录，不存在时返回None
+    def get(self, name):
+        row = self.conn.execute('SELECT data FROM devices WHERE name = ?', (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _upsert(self, name, record):
+        self.conn.execute(
+            'INSERT INTO devices (name, data, updated) VALUES (?, ?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET data = excluded.data, updated = excluded.updated',
+            (name, json.dumps(record), time.time()))
+
+    # 新增或更新单个设备的记录
+    def put(self, name, record):
+        with self.conn:
+            self._upsert(name, record)
+
+    # 在同一事务中读取、修改并写回单个设备的记录，返回修改后的记录
+    def update(self, name, func):
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')   # 先加写锁，避免与其他进程交错读改写
+            record = self.get(name) or {'unloaded': {}, 'loaded': {}}
+            func(record)
+            self._upsert(name, record)
+        return record
+
+    # 导出为旧版JSON格式
+    def export_json(self, path=DEVICES_FILE):
+        devices = {name: json.loads(data) for name, data in
+                   self.conn.execute('SELECT name, data FROM devices ORDER BY rowid')}
+        with open(path, 'w') as file:
+            json.dump(devices, file)
+
+    def close(self):
+        self.conn.close()
+
+
+# 把一次测量结果写入设备记录
+# mode: 'unloaded' 空载, 'loaded' 满载, 'min_max_voltage' 电压调节范围, 'clear' 清零
+def record_measurement(device, mode, metrics=None):
+    if mode in ('unloaded', 'loaded'):
+        device[mode] = metrics
+    elif mode == 'min_max_voltage':
+        min_max_range = device.get('min_max_range') or {}
+        max_voltage = max(min_max_range.get('max_voltage', -10), metrics['peak_voltage'])
+        min_voltage = min(min_max_range.get('min_voltage', 10), metrics['trough_voltage'])
+        device['min_max_range'] = {
+            'max_voltage': max_voltage,
+            'min_voltage': min_voltage,
+            'voltage_range': max_voltage - min_voltage
+        }
+    elif mode == 'clear':
+        device['min_max_range'] = {}
+
+    # 计算电压相对负载调整率为（满载-空载）/空载*100%
+    loaded = device.get('loaded') or {}
+    unloaded = device.get('unloaded') or {}
+    if 'mean_voltage' in loaded and 'mean_voltage' in unloaded:
+        loaded_mean = loaded['mean_voltage']
+        unloaded_mean = unloaded['mean_voltage']
+        device['carculation_results'] = {
+            'voltage_adjustment_rate': abs(loaded_mean - unloaded_mean) / unloaded_mean * 100
+        }
+    return device
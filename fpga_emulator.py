@@ -0,0 +1,230 @@
+import argparse
+import os
+import select
+import threading
+import tty
+import numpy as np
+from scipy.signal import lfilter
+from fpga_link import (volts_to_codes, codes_to_volts, transient_codes_to_volts, encode_frames, frame_blocks,
+                       make_decoder, STEADY_CALIBRATION, TRANSIENT_CALIBRATION, FRAME_BYTES, FRAME_HIGH_MAX,
+                       FRAMING_PLAIN, FRAMING_BLOCKS, FRAMINGS, BLOCK_SAMPLES, BLOCK_SEQ_MOD)
+
+# 模拟的FPGA流水线延迟（点数）
+EMULATOR_DELAY = 120
+# 自动判断激励编码方式时，一次至少收到这么多点才判断，更少时沿用上一次的判断
+DETECT_MIN_FRAMES = 64
+# FPGA采样率，用于低通滤波器
+EMULATOR_FS = 600000
+
+
+# 激励的编码方式：稳态激励的码值集中在两端（电压过零处回绕），瞬态激励的码值在中间
+def detect_mode(codes):
+    middle = np.count_nonzero((codes >= 1024) & (codes < 3072))
+    return 'transient' if middle * 2 > len(codes) else 'steady'
+
+
+# 本地FPGA模拟器：打开一对伪终端，按同样的12位协议（2字节帧或压缩帧）收发，
+# 收到的激励经过传递函数后回送，带流水线延迟，可按概率插入错位字节；
+# 默认由激励的码值判断稳态或瞬态的编码方式，同一个模拟器可以测试两种采集
+class FpgaEmulator:
+    def __init__(self, gain=1.0, offset=0.0, noise=0.0, lowpass=None, step_at=None, step=0.0,
+                 delay=EMULATOR_DELAY, glitch_rate=0.0, fs=EMULATOR_FS, mode='auto', link=None,
+                 seed=None, framing=FRAMING_PLAIN):
+        self.gain = gain
+        self.offset = offset
+        self.noise = noise                  # 白噪声标准差(V)
+        self.step_at = step_at              # 从第step_at个点起叠加阶跃
+        self.step = step
+        self.glitch_rate = glitch_rate      # 每帧插入一个错位字节的概率
+        self.mode = mode                    # 'steady'、'transient' 或 'auto'，决定激励和回送的编码方式
+        self.current_mode = None            # 当前使用的编码方式
+        self.link = link                    # 可选：指向从端的符号链接
+        if framing not in FRAMINGS:
+            raise ValueError(f'未知的帧格式: {framing}')
+        self.framing = framing
+        self._decoder = make_decoder(framing) if framing != FRAMING_PLAIN else None
+        self._block_codes = np.empty(0, dtype=np.int64)    # 校验块格式下未凑满一块的输出码值
+        self._block_seq = 0
+        self._rng = np.random.default_rng(seed)
+        if lowpass:
+            a = np.exp(-2 * np.pi * lowpass / fs)
+            self._filter = ([1 - a], [1, -a])
+            self._zi = None
+        else:
+            self._filter = None
+        self.delay = delay
+        self._delay_line = None
+        self._count = 0
+        self._pending = b''
+        self._out = bytearray()
+        self._stop = threading.Event()
+        self._thread = None
+        self.frames_in = 0
+        self.glitches = 0
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        if self.link:
+            if os.path.lexists(self.link):
+                os.remove(self.link)
+            os.symlink(self.port, self.link)
+
+    # 传递函数：激励电压 -> 输出电压
+    def transfer(self, volts):
+        out = volts * self.gain + self.offset
+        if self._filter is not None:
+            b, a = self._filter
+            if self._zi is None:
+                self._zi = np.array([out[0] * -a[1]])
+            out, self._zi = lfilter(b, a, out, zi=self._zi)
+        if self.step_at is not None:
+            index = self._count + np.arange(len(out))
+            out = out + np.where(index >= self.step_at, self.step, 0.0)
+        if self.noise:
+            out = out + self._rng.normal(0, self.noise, len(out))
+        return out
+
+    # 处理收到的字节，返回要回送的字节
+    def process(self, data):
+        if self._decoder is not None:
+            codes = self._decoder.feed(data).astype(np.int64)
+            frames = len(codes)
+        else:
+            data = self._pending + data
+            frames = len(data) // FRAME_BYTES
+            self._pending = data[frames * FRAME_BYTES:]
+            codes = np.frombuffer(data, dtype='>u2', count=frames).astype(np.int64) & 0x0FFF
+        if not frames:
+            return b''
+        mode = self.mode
+        if mode == 'auto':
+            mode = self.current_mode or 'steady'
+            if frames >= DETECT_MIN_FRAMES:
+                mode = detect_mode(codes)
+        if mode != self.current_mode:
+            # 编码方式改变（换了一种采集）时重新开始流水线和滤波器
+            if self.current_mode is not None:
+                self._delay_line = None
+                self._zi = None
+            self.current_mode = mode
+        if mode == 'transient':
+            volts = self.transfer(transient_codes_to_volts(codes))
+            out = volts_to_codes(volts, TRANSIENT_CALIBRATION)
+        else:
+            volts = self.transfer(codes_to_volts(codes, STEADY_CALIBRATION))
+            out = volts_to_codes(volts, STEADY_CALIBRATION)
+        out = np.clip(out, 0, 0x0FFF)
+        self._count += frames
+        self.frames_in += frames
+
+        # 流水线延迟，开始时流水线中为第一个输出点
+        if self._delay_line is None:
+            self._delay_line = np.full(self.delay, out[0], dtype=np.int64)
+        delayed = np.concatenate([self._delay_line, out])
+        out, self._delay_line = delayed[:frames], delayed[frames:]
+        if self.framing == FRAMING_BLOCKS:
+            # 校验块只发送满块，剩余的点等输入空闲时由flush()发送
+            out = np.concatenate([self._block_codes, out])
+            full = len(out) // BLOCK_SAMPLES * BLOCK_SAMPLES
+            out, self._block_codes = out[:full], out[full:]
+            return self._send_blocks(out)
+        return self._glitch(np.frombuffer(encode_frames(out, self.framing), dtype=np.uint8), frames)
+
+    def _send_blocks(self, codes):
+        if not len(codes):
+            return b''
+        raw = frame_blocks(codes, self._block_seq)
+        self._block_seq = (self._block_seq + -(-len(codes) // BLOCK_SAMPLES)) % BLOCK_SEQ_MOD
+        return self._glitch(np.frombuffer(raw, dtype=np.uint8), len(codes))
+
+    # 发送校验块格式下剩余的不满一块的点
+    def flush(self):
+        codes, self._block_codes = self._block_codes, np.empty(0, dtype=np.int64)
+        return self._send_blocks(codes)
+
+    # 按概率插入错位字节：2字节帧插在帧之间且高字节非法，其他格式插在任意位置且为任意值
+    def _glitch(self, raw, frames):
+        if self.glitch_rate:
+            hits = np.flatnonzero(self._rng.random(frames) < self.glitch_rate)
+            if self._decoder is not None:
+                where = np.sort(self._rng.integers(0, len(raw) + 1, hits.size))
+                low = 0
+            else:
+                where = hits * FRAME_BYTES
+                low = FRAME_HIGH_MAX + 1
+            if where.size:
+                stray = self._rng.integers(low, 0x100, where.size)
+                raw = np.insert(raw, where, stray.astype(np.uint8))
+                self.glitches += where.size
+        return raw.tobytes()
+
+    def serve_forever(self):
+        while not self._stop.is_set():
+            writable = [self.master] if self._out else []
+            readable, writable, _ = select.select([self.master], writable, [], 0.05)
+            if readable:
+                try:
+                    data = os.read(self.master, 65536)
+                except (BlockingIOError, OSError):
+                    data = b''
+                if data:
+                    self._out += self.process(data)
+            elif len(self._block_codes):
+                self._out += self.flush()
+            if writable and self._out:
+                try:
+                    n = os.write(self.master, self._out)
+                except BlockingIOError:
+                    n = 0
+                del self._out[:n]
+
+    # 在后台线程中运行
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='FPGA串口模拟器')
+    parser.add_argument('--gain', type=float, default=1.0, help='传递函数增益')
+    parser.add_argument('--offset', type=float, default=0.0, help='传递函数偏移(V)')
+    parser.add_argument('--noise', type=float, default=0.0, help='白噪声标准差(V)')
+    parser.add_argument('--lowpass', type=float, default=None, help='一阶低通截止频率(Hz)')
+    parser.add_argument('--step-at', type=int, default=None, help='从第N个点起叠加阶跃')
+    parser.add_argument('--step', type=float, default=0.0, help='阶跃幅度(V)')
+    parser.add_argument('--delay', type=int, default=EMULATOR_DELAY, help='流水线延迟(点)')
+    parser.add_argument('--glitch-rate', type=float, default=0.0, help='插入错位字节的概率')
+    parser.add_argument('--mode', choices=['auto', 'steady', 'transient'], default='auto',
+                        help='激励和回送的编码方式，auto由激励判断')
+    parser.add_argument('--link', default=None, help='创建指向模拟串口的符号链接')
+    parser.add_argument('--framing', choices=FRAMINGS, default=FRAMING_PLAIN, help='链路帧格式')
+    args = parser.parse_args()
+    emulator = FpgaEmulator(args.gain, args.offset, args.noise, args.lowpass, args.step_at, args.step,
+                            args.delay, args.glitch_rate, mode=args.mode, link=args.link,
+                            framing=args.framing)
+    print("模拟串口:", emulator.port)
+    print(f"python ser.py --port {args.link or emulator.port} --framing {args.framing}")
+    try:
+        emulator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
@@ -0,0 +1,705 @@
+import binascii
+import threading
+import time
+from functools import lru_cache
+import numpy as np
+import serial
+
+# 树莓派UART硬件串口默认参数
+DEFAULT_PORT = "/dev/ttyAMA0"
+DEFAULT_BAUDRATE = 115200
+DEFAULT_TIMEOUT = 0.1
+
+# FPGA串口协议：每个采样点为12位码值，按大端序占2个字节发送/接收
+FRAME_BYTES = 2
+# 单次write的字节数，避免逐点写串口
+WRITE_CHUNK = 8192
+# 链路帧格式：'plain' 每点2字节；'packed' 每2点3字节，按块加同步头；
+# 'blocks' 与packed相同的打包方式，定长块加序号和CRC，损坏的块只丢失本块
+FRAMING_PLAIN = 'plain'
+FRAMING_PACKED = 'packed'
+FRAMING_BLOCKS = 'blocks'
+FRAMINGS = (FRAMING_PLAIN, FRAMING_PACKED, FRAMING_BLOCKS)
+# 压缩帧的块：同步字节0xA5 + (本块点数-1) + ceil(点数/2)个3字节组，每块最多256点
+PACKED_SYNC = 0xA5
+PACKED_BLOCK_SAMPLES = 256
+PACKED_BLOCK_BYTES = 2 + PACKED_BLOCK_SAMPLES // 2 * 3
+# 校验块：同步字 0x5A 0xC3 + 序号(2字节大端) + (有效点数-1) + 256点的3字节组 + CRC-16/CCITT(2字节大端)，
+# 块长固定，最后一块不满时补0；CRC覆盖序号、点数和数据，初值0xFFFF
+BLOCK_SYNC = b'\x5a\xc3'
+BLOCK_SAMPLES = PACKED_BLOCK_SAMPLES
+BLOCK_HEADER = 5
+BLOCK_BYTES = BLOCK_HEADER + BLOCK_SAMPLES // 2 * 3 + 2
+BLOCK_SEQ_MOD = 1 << 16
+# 序号跳变超过这么多块时视为发送端重新开始计数，不补点
+BLOCK_MAX_GAP = 1024
+# 压缩帧重新对齐时跨过的字节数与整块相差不超过这么多字节时，按整块补点
+PACKED_MAX_SLIP = 8
+# ADC码值与电压之间的修正参数 (偏移, 比例)
+STEADY_CALIBRATION = (1.095, 0.935)
+TRANSIENT_CALIBRATION = (1.295, 0.866667)
+
+
+# 电压 -> 12位码值，是 codes_to_volts 的逆变换
+def volts_to_codes(values, calibration):
+    offset, scale = calibration
+    value = np.asarray(values, dtype=np.float64) / scale - offset
+    int_value = np.where(value > 0, 4096 - value / 5 * 2048, -value / 5 * 2048)
+    int_value = np.trunc(int_value).astype(np.int64)  # 与int()一致，向零取整
+    return 4095 - int_value
+
+
+# 稳态激励：浮点电压 -> 12位码值（与原逐点公式逐字节一致）
+def encode_steady_codes(values):
+    return volts_to_codes(values, STEADY_CALIBRATION)
+
+
+# 瞬态激励：浮点电压 -> 12位码值，范围从 (-5, 5) 映射到 (0, 4095)
+def encode_transient_codes(values):
+    values = np.asarray(values, dtype=np.float64)
+    int_value = np.trunc((1 - values / 5) * 2048).astype(np.int64)
+    return 4095 - int_value
+
+
+# 瞬态激励的逆变换：12位码值 -> 激励电压
+def transient_codes_to_volts(codes):
+    return (1 - (4095 - np.asarray(codes, dtype=np.int64)) / 2048) * 5
+
+
+# 码值数组 -> 大端序2字节帧
+def codes_to_frames(codes):
+    codes = np.asarray(codes)
+    if codes.size and (codes.min() < 0 or codes.max() > 0xFFFF):
+        raise ValueError('码值超出2字节帧范围')
+    return codes.astype('>u2').tobytes()
+
+
+# 码值数组 -> 压缩帧：每2点打包为3字节（a高8位, a低4位|b高4位, b低8位），
+# 每256点为一块，块头为同步字节和本块点数-1；点数为奇数时最后一组的第二点补0
+def pack_codes(codes):
+    codes = np.asarray(codes)
+    n = len(codes)
+    if n and (codes.min() < 0 or codes.max() > 0x0FFF):
+        raise ValueError('码值超出12位范围')
+    if not n:
+        return b''
+    blocks = -(-n // PACKED_BLOCK_SAMPLES)
+    out = np.empty((blocks, PACKED_BLOCK_BYTES), dtype=np.uint8)
+    out[:, 0] = PACKED_SYNC
+    out[:, 1] = PACKED_BLOCK_SAMPLES - 1
+    out[:, 2:] = pack_groups(codes, blocks * PACKED_BLOCK_SAMPLES).reshape(blocks, -1)
+    # 最后一块可能不满，截掉补齐的组
+    last = n - (blocks - 1) * PACKED_BLOCK_SAMPLES
+    out[-1, 1] = last - 1
+    size = (blocks - 1) * PACKED_BLOCK_BYTES + 2 + -(-last // 2) * 3
+    return out.reshape(-1)[:size].tobytes()
+
+
+# 码值数组补0到size点后，每2点打包为一个3字节组，返回(size/2, 3)的uint8数组
+def pack_groups(codes, size):
+    padded = np.zeros(size, dtype=np.uint16)
+    padded[:len(codes)] = codes
+    pairs = padded.reshape(-1, 2)
+    a, b = pairs[:, 0], pairs[:, 1]
+    groups = np.empty((len(pairs), 3), dtype=np.uint8)
+    groups[:, 0] = a >> 4
+    groups[:, 1] = ((a & 0x0F) << 4) | (b >> 8)
+    groups[:, 2] = b & 0xFF
+    return groups
+
+
+# 码值数组 -> 校验块，序号从seq开始递增（模65536）
+def frame_blocks(codes, seq=0):
+    codes = np.asarray(codes)
+    n = len(codes)
+    if n and (codes.min() < 0 or codes.max() > 0x0FFF):
+        raise ValueError('码值超出12位范围')
+    if not n:
+        return b''
+    blocks = -(-n // BLOCK_SAMPLES)
+    seqs = (seq + np.arange(blocks)) % BLOCK_SEQ_MOD
+    out = np.empty((blocks, BLOCK_BYTES), dtype=np.uint8)
+    out[:, 0] = BLOCK_SYNC[0]
+    out[:, 1] = BLOCK_SYNC[1]
+    out[:, 2] = seqs >> 8
+    out[:, 3] = seqs & 0xFF
+    out[:, 4] = BLOCK_SAMPLES - 1
+    out[-1, 4] = n - (blocks - 1) * BLOCK_SAMPLES - 1
+    out[:, BLOCK_HEADER:-2] = pack_groups(codes, blocks * BLOCK_SAMPLES).reshape(blocks, -1)
+    crcs = block_crcs(out)
+    out[:, -2] = crcs >> 8
+    out[:, -1] = crcs & 0xFF
+    return out.tobytes()
+
+
+# 每个校验块(blocks, BLOCK_BYTES)应有的CRC：序号、点数和数据部分的CRC-16/CCITT
+def block_crcs(blocks):
+    return np.array([binascii.crc_hqx(block[2:-2], 0xFFFF) for block in blocks], dtype=np.uint16)
+
+
+# 3字节组数组(k, 3) -> 码值数组(2k)
+def unpack_groups(groups):
+    groups = groups.astype(np.uint16)
+    codes = np.empty((len(groups), 2), dtype=np.uint16)
+    codes[:, 0] = (groups[:, 0] << 4) | (groups[:, 1] >> 4)
+    codes[:, 1] = ((groups[:, 1] & 0x0F) << 8) | groups[:, 2]
+    return codes.reshape(-1)
+
+
+# 按链路帧格式编码码值
+def encode_frames(codes, framing=FRAMING_PLAIN):
+    if framing == FRAMING_PACKED:
+        return pack_codes(codes)
+    if framing == FRAMING_BLOCKS:
+        return frame_blocks(codes)
+    return codes_to_frames(codes)
+
+
+def encode_steady_stimulus(values, framing=FRAMING_PLAIN):
+    return encode_frames(encode_steady_codes(values), framing)
+
+
+def encode_transient_stimulus(values, framing=FRAMING_PLAIN):
+    return encode_frames(encode_transient_codes(values), framing)
+
+
+# 分块发送整段帧数据，返回发送的字节数；cancel: 可选的取消标志
+def write_frames(ser, payload, chunk_size=WRITE_CHUNK, cancel=None):
+    view = memoryview(payload)
+    sent = 0
+    while sent < len(view):
+        # 每块之间检查取消标志，长激励发送中途也能停止
+        if cancel is not None and cancel.cancelled:
+            break
+        n = ser.write(view[sent:sent + chunk_size])
+        sent += n if n else min(chunk_size, len(view) - sent)
+    return sent
+
+
+# 单次read的最大字节数
+READ_CHUNK = 16384
+# 读空接收端的最长时间(s)
+DRAIN_LIMIT = 60
+# 合法帧的高字节不超过0x0F（12位码值）
+FRAME_HIGH_MAX = 0x0F
+
+
+# ADC码值个数（12位）
+ADC_CODES = 4096
+
+
+# 码值 -> 未修正的电压（原逐点公式中偏移和比例之前的部分）
+def adc_nominal_volts(codes):
+    value = 4095 - np.asarray(codes, dtype=np.int32)
+    return np.where(value > 2048, (4096 - value) / 2048 * 5, -value * 5 / 2048)
+
+
+# 修正参数可以是 (偏移, 比例)，或修正参数字典：
+#   {'offset': 偏移, 'scale': 比例}                       (v + 偏移) * 比例
+#   {'points': [[码值, 电压], ...]}                        按未修正电压分段线性插值，两端线性外推
+# 转换为可哈希的键，用于缓存查找表
+def calibration_key(calibration):
+    if isinstance(calibration, dict):
+        points = calibration.get('points')
+        if points:
+            return None, None, tuple((int(code), float(volts)) for code, volts in points)
+        return float(calibration['offset']), float(calibration['scale']), None
+    offset, scale = calibration
+    return float(offset), float(scale), None
+
+
+# 修正参数的JSON形式：线性修正保存为 [偏移, 比例]（与之前保存的文件兼容），分段修正保存为字典
+def calibration_json(calibration):
+    offset, scale, points = calibration_key(calibration)
+    if points:
+        return {'points': [list(p) for p in points]}
+    return [offset, scale]
+
+
+# 把修正参数编译为4096项的查找表，并按电压排序（用于逆变换）；按参数缓存
+@lru_cache(maxsize=64)
+def _compile_calibration(key):
+    offset, scale, points = key
+    nominal = adc_nominal_volts(np.arange(ADC_CODES))
+    if points:
+        x = adc_nominal_volts([code for code, _ in points])
+        y = np.array([volts for _, volts in points])
+        order = np.argsort(x)
+        x, y = x[order], y[order]
+        if len(x) < 2 or np.any(np.diff(x) <= 0):
+            raise ValueError('分段修正至少需要两个不同码值的点')
+        table = np.interp(nominal, x, y)
+        # 两端按最外侧的线段外推
+        low, high = nominal < x[0], nominal > x[-1]
+        table[low] = y[0] + (nominal[low] - x[0]) * (y[1] - y[0]) / (x[1] - x[0])
+        table[high] = y[-1] + (nominal[high] - x[-1]) * (y[-1] - y[-2]) / (x[-1] - x[-2])
+    else:
+        table = (nominal + offset) * scale
+    order = np.argsort(table, kind='stable')
+    sorted_volts = table[order]
+    for array in (table, order, sorted_volts):
+        array.flags.writeable = False
+    return table, order, sorted_volts
+
+
+# 修正参数对应的查找表：码值 -> 电压，只读
+def calibration_table(calibration=STEADY_CALIBRATION):
+    return _compile_calibration(calibration_key(calibration))[0]
+
+
+# 12位码值数组 -> 电压数组：按修正参数的查找表取值（线性修正时与原逐点公式一致）
+def codes_to_volts(codes, calibration=STEADY_CALIBRATION):
+    return calibration_table(calibration).take(np.asarray(codes, dtype=np.intp))
+
+
+# 电压数组 -> 最接近的12位码值，是 codes_to_volts 的精确逆变换（用于按码值存档）
+def volts_to_adc_codes(volts, calibration=STEADY_CALIBRATION):
+    _, order, sorted_volts = _compile_calibration(calibration_key(calibration))
+    v = np.asarray(volts, dtype=np.float64)
+    # 在排序后的查找表中找到两侧的电压，取较近的一个
+    upper = np.clip(np.searchsorted(sorted_volts, v), 1, ADC_CODES - 1)
+    lower = upper - 1
+    nearer = np.where(v - sorted_volts[lower] <= sorted_volts[upper] - v, lower, upper)
+    return order[nearer].astype(np.int16)
+
+
+# 解码器公共部分：整块缓冲，跨块保留不完整的帧；各帧格式只实现feed中的解析循环
+class FrameDecoder:
+    def __init__(self, capacity=READ_CHUNK * 2):
+        self._buf = bytearray(capacity)
+        self._pending = 0        # 缓冲区头部残留的未成帧字节数
+        self.resyncs = 0         # 帧错位重同步次数
+        self.bytes_in = 0
+
+    def reset(self):
+        self._pending = 0
+        self.resyncs = 0
+        self.bytes_in = 0
+
+    @property
+    def pending(self):
+        return self._pending
+
+    # 把新字节接在残留字节后面，返回缓冲区的uint8视图和有效字节数
+    def _append(self, data):
+        n = len(data)
+        total = self._pending + n
+        if total > len(self._buf):
+            grown = bytearray(max(total, len(self._buf) * 2))
+            grown[:self._pending] = self._buf[:self._pending]
+            self._buf = grown
+        self._buf[self._pending:total] = data
+        self.bytes_in += n
+        return np.frombuffer(self._buf, dtype=np.uint8, count=total), total
+
+    # 解析结束：先复制出码值，再把pos之后的残留字节移到缓冲区头部
+    def _finish(self, segments, pos, total):
+        if not segments:
+            codes = np.empty(0, dtype=np.uint16)
+        elif len(segments) == 1:
+            codes = segments[0].astype(np.uint16)
+        else:
+            codes = np.concatenate(segments).astype(np.uint16)
+        self._pending = total - pos
+        if self._pending:
+            self._buf[:self._pending] = self._buf[pos:total]
+        return codes
+
+
+# 接收流解码器：向量化帧对齐
+class StreamDecoder(FrameDecoder):
+    # 再得到samples个码值还需要读取的字节数
+    def bytes_needed(self, samples):
+        return max(FRAME_BYTES * samples - self._pending, 0)
+
+    # 输入一段原始字节，返回其中完整帧的码值(uint16)
+    def feed(self, data):
+        raw, total = self._append(data)
+        segments = []
+        pos = 0
+        while total - pos >= 2:
+            frames = (total - pos) // 2
+            high = raw[pos:pos + 2 * frames:2]
+            bad = np.flatnonzero(high > FRAME_HIGH_MAX)
+            good = frames if bad.size == 0 else int(bad[0])
+            if good:
+                segments.append(np.frombuffer(self._buf, dtype='>u2', count=good, offset=pos))
+                pos += 2 * good
+            if bad.size == 0:
+                break
+            # 高字节非法说明帧错位，丢弃1个字节重新对齐
+            pos += 1
+            self.resyncs += 1
+        return self._finish(segments, pos, total)
+
+
+# 压缩帧解码器：整块到达后才输出；块头正确且下一块的同步字节也在应有的位置时才接受该块，
+# 完整块一次向量化校验；不合法时逐字节寻找下一个能确认的块重新对齐，
+# 按跳过的字节数估计丢失的点数，重复上一个码值补点使后续数据不错位，并记录补点的位置和链路错误统计
+class PackedDecoder(FrameDecoder):
+    def __init__(self, capacity=READ_CHUNK * 2):
+        super().__init__(capacity)
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self._carry = np.empty(0, dtype=np.uint16)   # 已解码但调用方暂不需要的码值
+        self._synced = False        # 是否已经接受过块，开头对齐之前跳过的字节不补点
+        self._lost_at = None        # 正在重新对齐时，跳过的第一个字节在接收流中的序号
+        self._last = 0              # 最近一个有效码值，用于补点
+        self.samples_out = 0        # 已输出的点数（含补点）
+        self.bad_blocks = 0         # 丢弃的坏块（压缩帧为没有通过确认的块，校验块为CRC错误的块）
+        self.lost_blocks = 0        # 补点的块数
+        self.skipped_bytes = 0      # 重新对齐时丢弃的字节数
+        self.damaged = []           # 补点的区间 [(起始序号, 结束序号)]，按输出点数计
+
+    # 退回多解码出的码值，下次feed时最先返回
+    def unread(self, codes):
+        self._carry = np.concatenate([codes, self._carry]).astype(np.uint16)
+
+    # 再得到samples个码值还需要读取的字节数（按整块计算，再加确认用的下一块的同步字节）
+    def bytes_needed(self, samples):
+        samples -= len(self._carry)
+        if samples <= 0:
+            return 0
+        blocks = -(-samples // PACKED_BLOCK_SAMPLES)
+        return max(blocks * PACKED_BLOCK_BYTES + 1 - self._pending, 0)
+
+    # 从pos开始的块是否合法（块头正确且下一块以同步字节开头），返回块长度，
+    # 数据不足以确认时返回0，不合法时返回None
+    def _block_at(self, raw, pos, total):
+        if total - pos < 2:
+            return 0
+        if raw[pos] != PACKED_SYNC:
+            return None
+        size = 2 + -(-(int(raw[pos + 1]) + 1) // 2) * 3
+        if total - pos <= size:
+            return 0
+        if raw[pos + size] != PACKED_SYNC:
+            return None
+        return size
+
+    # 输出一段解码出的码值
+    def _emit(self, codes, segments):
+        segments.append(codes)
+        self.samples_out += len(codes)
+        self._last = codes[-1]
+        self._synced = True
+
+    # 在丢失数据处重复上一个码值补count个点，记录补点的区间
+    def _fill(self, count, segments):
+        segments.append(np.full(count, self._last, dtype=np.uint16))
+        self.damaged.append((self.samples_out, self.samples_out + count))
+        self.samples_out += count
+        self.lost_blocks += -(-count // PACKED_BLOCK_SAMPLES)
+
+    # pos处的块已确认：之前在重新对齐时，按跳过的字节数补点；
+    # 与整块相差不超过PACKED_MAX_SLIP字节时按整块计（错位字节或丢失的字节），否则按比例估计
+    def _recover(self, pos, total, segments):
+        if self._lost_at is None:
+            return
+        span = self.bytes_in - total + pos - self._lost_at
+        self._lost_at = None
+        self.skipped_bytes += span
+        if not self._synced:
+            return
+        blocks = round(span / PACKED_BLOCK_BYTES)
+        if blocks and abs(span - blocks * PACKED_BLOCK_BYTES) <= PACKED_MAX_SLIP:
+            count = blocks * PACKED_BLOCK_SAMPLES
+        else:
+            count = round(span * PACKED_BLOCK_SAMPLES / PACKED_BLOCK_BYTES)
+        if 0 < count <= BLOCK_MAX_GAP * PACKED_BLOCK_SAMPLES:
+            self._fill(count, segments)
+
+    def feed(self, data):
+        raw, total = self._append(data)
+        segments = [self._carry] if len(self._carry) else []
+        self._carry = np.empty(0, dtype=np.uint16)
+        pos = 0
+        while True:
+            # 完整的满块一次校验并解码，每块还要由下一块的同步字节确认
+            full = (total - pos) // PACKED_BLOCK_BYTES
+            if full:
+                end = pos + full * PACKED_BLOCK_BYTES
+                blocks = raw[pos:end].reshape(full, PACKED_BLOCK_BYTES)
+                ok = (blocks[:, 0] == PACKED_SYNC) & (blocks[:, 1] == PACKED_BLOCK_SAMPLES - 1)
+                ok[:-1] &= blocks[1:, 0] == PACKED_SYNC
+                ok[-1] &= end < total and raw[end] == PACKED_SYNC
+                good = full if ok.all() else int(np.argmin(ok))
+                if good:
+                    self._recover(pos, total, segments)
+                    self._emit(unpack_groups(blocks[:good, 2:].reshape(-1, 3)), segments)
+                    pos += good * PACKED_BLOCK_BYTES
+            # 不满的块、块头不对或没有通过确认
+            size = self._block_at(raw, pos, total)
+            if size is None:
+                if self._lost_at is None:
+                    self._lost_at = self.bytes_in - total + pos
+                    if raw[pos] == PACKED_SYNC:
+                        self.bad_blocks += 1
+                skip = self._buf.find(bytes([PACKED_SYNC]), pos + 1, total)
+                pos = total if skip < 0 else skip
+                self.resyncs += 1
+                continue
+            if size == 0:
+                break
+            self._recover(pos, total, segments)
+            count = int(raw[pos + 1]) + 1
+            self._emit(unpack_groups(raw[pos + 2:pos + size].reshape(-1, 3))[:count], segments)
+            pos += size
+        return self._finish(segments, pos, total)
+
+
+# 校验块解码器：完整块的同步字和CRC一次校验；坏块丢弃后寻找下一个同步字，
+# 按序号补上丢失的块（重复上一个码值）使后续数据不错位，并记录补点的位置和链路错误统计
+class BlockDecoder(PackedDecoder):
+    def reset(self):
+        super().reset()
+        self._seq = None            # 下一块应有的序号，None表示还没有收到过块
+        self.blocks_ok = 0
+
+    def bytes_needed(self, samples):
+        samples -= len(self._carry)
+        if samples <= 0:
+            return 0
+        blocks = -(-samples // BLOCK_SAMPLES)
+        return max(blocks * BLOCK_BYTES - self._pending, 0)
+
+    # 一组校验通过的连续块 -> 码值；序号不连续时在其前面补点
+    def _decode_blocks(self, blocks, segments):
+        seqs = (blocks[:, 2].astype(np.int64) << 8) | blocks[:, 3]
+        prev = np.concatenate([[seqs[0] - 1 if self._seq is None else self._seq - 1], seqs[:-1]])
+        gaps = (seqs - prev - 1) % BLOCK_SEQ_MOD
+        counts = blocks[:, 4].astype(np.int64) + 1
+        codes = unpack_groups(blocks[:, BLOCK_HEADER:-2].reshape(-1, 3)).reshape(len(blocks), BLOCK_SAMPLES)
+        # 在序号跳变处分段
+        bounds = np.union1d(np.flatnonzero(gaps), [0, len(blocks)])
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            gap = int(gaps[start])
+            if 0 < gap <= BLOCK_MAX_GAP:
+                self._fill(gap * BLOCK_SAMPLES, segments)
+            part = codes[start:stop]
+            if (counts[start:stop] == BLOCK_SAMPLES).all():
+                part = part.reshape(-1)
+            else:
+                part = part[np.arange(BLOCK_SAMPLES) < counts[start:stop, None]]
+            self._emit(part, segments)
+        self._seq = int(seqs[-1] + 1) % BLOCK_SEQ_MOD
+        self.blocks_ok += len(blocks)
+
+    def feed(self, data):
+        raw, total = self._append(data)
+        segments = [self._carry] if len(self._carry) else []
+        self._carry = np.empty(0, dtype=np.uint16)
+        pos = 0
+        while total - pos >= BLOCK_BYTES:
+            full = (total - pos) // BLOCK_BYTES
+            blocks = raw[pos:pos + full * BLOCK_BYTES].reshape(full, BLOCK_BYTES)
+            sync = (blocks[:, 0] == BLOCK_SYNC[0]) & (blocks[:, 1] == BLOCK_SYNC[1])
+            crc = (blocks[:, -2].astype(np.uint16) << 8) | blocks[:, -1]
+            ok = sync.copy()
+            ok[sync] = block_crcs(blocks[sync]) == crc[sync]
+            good = full if ok.all() else int(np.argmin(ok))
+            if good:
+                self._decode_blocks(blocks[:good], segments)
+                pos += good * BLOCK_BYTES
+            if good == full:
+                break
+            # 坏块：从下一个字节起寻找同步字，由下一轮的CRC校验确认
+            if sync[good]:
+                self.bad_blocks += 1
+            skip = self._buf.find(BLOCK_SYNC, pos + 1, total)
+            skip = total - 1 if skip < 0 else skip
+            self.skipped_bytes += skip - pos
+            self.resyncs += 1
+            pos = skip
+        return self._finish(segments, pos, total)
+
+
+# 链路错误统计：累计值和最近一次采集的值，damaged为最近一次采集中补点的区间（按采集结果的序号）
+# filled为当前采集结果（平均频谱模式包含多次采集）中补点的总点数，有补点的结果不能用于测量
+class LinkStats:
+    FIELDS = ('bytes_in', 'resyncs', 'bad_blocks', 'lost_blocks', 'skipped_bytes')
+
+    def __init__(self):
+        self.captures = 0
+        self.total = dict.fromkeys(self.FIELDS, 0)
+        self.last = dict.fromkeys(self.FIELDS, 0)
+        self.damaged = []
+        self.filled = 0
+
+    # 开始一个新的采集结果
+    def begin(self):
+        self.damaged = []
+        self.filled = 0
+
+    # 合并一次采集的解码器统计；offset为采集结果第一个点在接收流中的序号，count为采集结果的点数
+    def add(self, decoder, offset=0, count=None):
+        self.captures += 1
+        for key in self.FIELDS:
+            self.last[key] = getattr(decoder, key, 0)
+            self.total[key] += self.last[key]
+        self.damaged = []
+        for start, stop in getattr(decoder, 'damaged', []):
+            start, stop = max(start - offset, 0), stop - offset
+            if count is not None:
+                stop = min(stop, count)
+            if stop > start:
+                self.damaged.append((start, stop))
+        self.filled += sum(stop - start for start, stop in self.damaged)
+
+    @property
+    def errors(self):
+        return self.last['resyncs'] + self.last['bad_blocks'] + self.last['lost_blocks']
+
+    # 最近一次采集的链路错误，一行文字
+    def summary(self):
+        text = f"链路: 重同步 {self.last['resyncs']} 次"
+        if self.last['skipped_bytes']:
+            text += f"，丢弃 {self.last['skipped_bytes']} 字节"
+        if self.last['bad_blocks'] or self.last['lost_blocks']:
+            text += f"，坏块 {self.last['bad_blocks']}，补点 {self.last['lost_blocks']} 块（{self.filled} 点）"
+        if self.filled:
+            text += '，不能用于测量'
+        return text
+
+
+# 按链路帧格式创建接收解码器
+def make_decoder(framing=FRAMING_PLAIN):
+    if framing == FRAMING_PACKED:
+        return PackedDecoder()
+    if framing == FRAMING_BLOCKS:
+        return BlockDecoder()
+    return StreamDecoder()
+
+
+# 读空接收端，直到串口安静一个读超时为止（对端仍在回送的数据也一并丢弃）；
+# 最多读limit秒，返回丢弃的字节数
+def drain_input(ser, limit=DRAIN_LIMIT):
+    dropped = 0
+    deadline = time.monotonic() + limit
+    while time.monotonic() < deadline:
+        data = ser.read(max(ser.in_waiting, 1))
+        if not data:
+            break
+        dropped += len(data)
+    return dropped
+
+
+# 从串口读取count个码值；超时无数据时提前返回已读到的部分
+def read_codes(ser, count, decoder=None):
+    if decoder is None:
+        decoder = StreamDecoder()
+    out = np.empty(count, dtype=np.uint16)
+    got = 0
+    while got < count:
+        remaining = decoder.bytes_needed(count - got)
+        if remaining:
+            size = min(max(ser.in_waiting, min(remaining, READ_CHUNK)), remaining)
+            chunk = ser.read(size)
+            if not chunk:
+                break
+        else:
+            chunk = b''     # 解码器中已有足够的码值
+        codes = decoder.feed(chunk)
+        take = min(len(codes), count - got)
+        out[got:got + take] = codes[:take]
+        if take < len(codes):
+            decoder.unread(codes[take:])
+        got += take
+        if not chunk and not take:
+            break
+    return out[:got]
+
+
+# 长期持有的串口会话：按需打开，出错时重连，两种采集共用
+class SerialSession:
+    def __init__(self, port=DEFAULT_PORT, baudrate=DEFAULT_BAUDRATE, timeout=DEFAULT_TIMEOUT,
+                 retries=1, verbose=True, framing=FRAMING_PLAIN):
+        if framing not in FRAMINGS:
+            raise ValueError(f'不支持的链路帧格式: {framing}')
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.framing = framing      # 链路帧格式，须与FPGA端的配置一致
+        self.link_stats = LinkStats()
+        self.retries = retries      # 串口出错时重连重试的次数
+        self.verbose = verbose      # 打开串口时打印串口参数
+        self._ser = None
+        self._lock = threading.RLock()
+
+    @property
+    def is_open(self):
+        return self._ser is not None and self._ser.is_open
+
+    # 打开串口（已打开时直接返回）
+    def open(self):
+        with self._lock:
+            if not self.is_open:
+                self._ser = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
+                if self.verbose:
+                    print("open success")
+                    print("串口详情参数：", self._ser)
+            return self._ser
+
+    def close(self):
+        with self._lock:
+            if self._ser is not None:
+                try:
+                    self._ser.close()
+                finally:
+                    self._ser = None
+
+    def reconnect(self):
+        with self._lock:
+            self.close()
+            return self.open()
+
+    # 修改串口参数，下次使用时按新参数重新打开
+    def configure(self, port=None, baudrate=None, timeout=None, framing=None):
+        with self._lock:
+            if framing is not None:
+                if framing not in FRAMINGS:
+                    raise ValueError(f'不支持的链路帧格式: {framing}')
+                self.framing = framing
+            if port is not None:
+                self.port = port
+            if baudrate is not None:
+                self.baudrate = baudrate
+            if timeout is not None:
+                self.timeout = timeout
+            self.close()
+
+    # 丢弃收发缓冲区中残留的数据
+    def flush(self):
+        with self._lock:
+            ser = self.open()
+            ser.reset_output_buffer()
+            ser.reset_input_buffer()
+
+    # 等待发送完成，并读空接收端直到串口安静一个读超时，返回丢弃的字节数
+    def drain(self):
+        with self._lock:
+            ser = self.open()
+            ser.flush()
+            return drain_input(ser)
+
+    # 在会话上执行func(ser)；串口出错时重连并重试，读超时（FPGA没有回送数据）不重试
+    # 执行前先读空上一次采集仍在回送的数据，避免新采集以上一次的尾部开头
+    def run(self, func, *args, **kwargs):
+        with self._lock:
+            attempt = 0
+            while True:
+                try:
+                    ser = self.open()
+                    ser.reset_input_buffer()
+                    self.drain()
+                    self.link_stats.begin()
+                    return func(ser, *args, **kwargs)
+                except TimeoutError:
+                    raise
+                except (serial.SerialException, OSError):
+                    self.close()
+                    if attempt >= self.retries:
+                        raise
+                    attempt += 1
@@ -1,21 +1,43 @@
+import time
+STARTUP_T0 = time.perf_counter()   # 启动计时起点
 import sys
-import numpy as np
 import json
-import serial
-import csv
-from scipy.fftpack import fft
-import matplotlib.pyplot as plt
+import numpy as np
+import argparse
+from functools import lru_cache
+import matplotlib
+from matplotlib.figure import Figure
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QVBoxLayout
                              , QHBoxLayout, QWidget, QLineEdit, QFormLayout, QTextEdit
-                             , QComboBox, QLabel, QInputDialog, QFileDialog, QMessageBox,QApplication)
-from PyQt5.QtCore import QTimer
+                             , QComboBox, QLabel, QInputDialog, QFileDialog, QMessageBox,QApplication
+                             , QCheckBox, QSpinBox)
+from PyQt5.QtCore import QTimer, QObject, QThread, pyqtSignal
 from PyQt5.QtGui import QPainter, QColor, QRadialGradient, QBrush
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QGridLayout
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from acquisition import (CancelToken, add_noise, capture_steady, capture_transient,
+                         capture_continuous, capture_averaged, averaged_spectrum, RingBuffer, NUM_SAMPLES, FS, PIPELINE_DELAY,
+                         TRANSIENT_SAMPLES, RING_CAPACITY, PRE_TRIGGER, POST_TRIGGER_WINDOW)
+from analysis import analyze_spectrum, minmax_envelope, signal_metrics, SignalStats, NUM_PEAKS
+from device_store import DeviceStore, record_measurement
+from fpga_link import (SerialSession, DEFAULT_PORT, DEFAULT_BAUDRATE, DEFAULT_TIMEOUT, STEADY_CALIBRATION,
+                       TRANSIENT_CALIBRATION, FRAMING_PLAIN, FRAMINGS, calibration_key, codes_to_volts)
+from calibration import select_profile, set_profile, gain_key
+from waveform_archive import save_waveform, WAVEFORM_SUFFIX
+from csv_import import load_capture, write_capture_csv
+from waveform_history import WaveformHistory
+from stage_timing import StageTimer
 import os
 os.environ['DISPLAY'] = "localhost:10.0"
 
+STARTUP_IMPORT_MS = (time.perf_counter() - STARTUP_T0) * 1000   # 模块导入耗时
+# 导出格式：默认二进制波形文件，CSV可选
+EXPORT_FILTER = f'Waveform Files (*{WAVEFORM_SUFFIX});;CSV Files (*.csv)'
+
+# FFT图显示的最高频率
+FFT_XMAX = 5000
+
 class LedIndicator(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -54,15 +76,77 @@ class OverlayWidget(QWidget):
     def paintEvent(self, event):
         pass
 
+# 采集工作对象，运行在独立的QThread中
+class AcquisitionWorker(QObject):
+    progress = pyqtSignal(int, int)         # 已读点数, 总点数
+    partial = pyqtSignal(str, object)       # 模式, 本块电压数据
+    finished = pyqtSignal(str, object)      # 模式, 采集结果
+    failed = pyqtSignal(str)
+    done = pyqtSignal()
+
+    captures = {
+        'steady': capture_steady,
+        'transient': capture_transient,
+        'continuous': capture_continuous,
+        'averaged': capture_averaged,
+    }
+
+    def __init__(self, mode, session, cancel, timer=None, **options):
+        super().__init__()
+        self.mode = mode
+        self.session = session
+        self.cancel = cancel
+        self.timer = timer          # 开启计时时为StageTimer，记录打开串口和收发阶段
+        self.options = options
+
+    def report(self, got, total, volts):
+        self.progress.emit(got, total)
+        self.partial.emit(self.mode, volts)
+
+    def run(self):
+        try:
+            if self.timer is not None:
+                with self.timer.stage('open'):
+                    self.session.open()
+                self.options['timer'] = self.timer
+            result = self.session.run(self.captures[self.mode], self.cancel, self.report,
+                                      framing=self.session.framing, link_stats=self.session.link_stats,
+                                      **self.options)
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.finished.emit(self.mode, result)
+        self.done.emit()
+
+# 字体设置只做一次；找不到SimHei时使用默认字体，避免每次绘图都重新查找字体
+@lru_cache(maxsize=None)
+def setupFonts():
+    from matplotlib import font_manager
+    matplotlib.rcParams['axes.unicode_minus'] = False  # 解决保存图像是负号'-'显示为方块的问题
+    try:
+        font_manager.findfont(font_manager.FontProperties(family='SimHei'), fallback_to_default=False)
+    except ValueError:
+        return None
+    matplotlib.rcParams['font.family'] = 'SimHei'
+    return 'SimHei'
+
+# 导出文件名没有扩展名时按二进制波形文件保存
+def exportPath(file_name):
+    return file_name if os.path.splitext(file_name)[1] else file_name + WAVEFORM_SUFFIX
+
 class SignalAnalyzer(QMainWindow):
-    def __init__(self):
+    def __init__(self, port=DEFAULT_PORT, baudrate=DEFAULT_BAUDRATE, timeout=DEFAULT_TIMEOUT,
+                 auto_capture=True, exit_after_startup=False, timing=False, framing=FRAMING_PLAIN):
         super().__init__()
+        # 分阶段计时，关闭时不做任何记录
+        self.timer = StageTimer(timing)
+        # 串口会话在程序运行期间保持打开
+        self.serial_session = SerialSession(port, baudrate, timeout, framing=framing)
+        self.auto_capture = auto_capture
+        self.exit_after_startup = exit_after_startup
+        self.startup_times = {'import': STARTUP_IMPORT_MS}    # 启动各阶段耗时(ms)
         self.initializeUI()
 
-    plt.rcParams['axes.unicode_minus'] = False  # 解决保存图像是负号'-'显示为方块的问题
-    plt.rc('font',family='SimHei')
-    #plt.style.use('ggplot')   
-
     def initializeUI(self):
         self.setWindowTitle('Signal Analyzer')
         self.setGeometry(0, 0, 1400, 750)
@@ -74,10 +158,18 @@ class SignalAnalyzer(QMainWindow):
         graph_layout = QVBoxLayout()
 
         # 创建两个Figure和FigureCanvas来显示图形
-        self.figure1, self.ax1 = plt.subplots(2, 1, figsize=(10, 7), tight_layout=True)
+        setupFonts()
+        self.figure1 = Figure(figsize=(10, 7), tight_layout=True)
+        self.ax1 = self.figure1.subplots(2, 1)
         self.canvas1 = FigureCanvas(self.figure1)
-        self.figure2, self.ax2 = plt.subplots(1, 1, figsize=(10, 4.5), tight_layout=True)
+        self.figure2 = Figure(figsize=(10, 4.5), tight_layout=True)
+        self.ax2 = self.figure2.subplots(1, 1)
         self.canvas2 = FigureCanvas(self.figure2)
+        self.setupPlots()
+        if self.timer.enabled:
+            # 记录实际重绘的耗时（draw_idle合并后的draw）
+            self.canvas1.draw = self.timer.wrap(self.canvas1.draw, 'draw')
+            self.canvas2.draw = self.timer.wrap(self.canvas2.draw, 'draw_transient')
 
         # 创建一个水平布局用于控制信号增益
         gain_layout = QHBoxLayout()
@@ -135,7 +227,14 @@ class SignalAnalyzer(QMainWindow):
         self.time_dalay_reduce_button.setFixedWidth(80)
         self.time_dalay_reduce_button.clicked.connect(self.timeDelayReduce)
 
+        # 平均次数大于1时多次采集，用平均频谱计算纹波
+        self.average_spin = QSpinBox(self)
+        self.average_spin.setRange(1, 64)
+        self.average_spin.setValue(1)
+        self.average_spin.setPrefix('平均 ')
+
         time_base.addWidget(self.get_data_button)
+        time_base.addWidget(self.average_spin)
         time_base.addWidget(self.time_base_reduce_button)
         time_base.addWidget(self.time_base_increase_button)
         time_base.addWidget(self.time_dalay_reduce_button)
@@ -168,6 +267,20 @@ class SignalAnalyzer(QMainWindow):
         transient_signal_layout.addWidget(self.stop_button)
         transient_signal_layout.addWidget(self.save_button)
 
+        # 连续触发模式：持续采集直到触发，保留触发前后的窗口
+        self.continuous_check = QCheckBox('连续触发', self)
+        self.pre_trigger_spin = QSpinBox(self)
+        self.pre_trigger_spin.setRange(0, RING_CAPACITY // 2)
+        self.pre_trigger_spin.setValue(PRE_TRIGGER)
+        self.pre_trigger_spin.setPrefix('触发前 ')
+        self.post_trigger_spin = QSpinBox(self)
+        self.post_trigger_spin.setRange(1, RING_CAPACITY // 2)
+        self.post_trigger_spin.setValue(POST_TRIGGER_WINDOW)
+        self.post_trigger_spin.setPrefix('触发后 ')
+        transient_signal_layout.addWidget(self.continuous_check)
+        transient_signal_layout.addWidget(self.pre_trigger_spin)
+        transient_signal_layout.addWidget(self.post_trigger_spin)
+
         # 将图形画布添加到布局中
         graph_layout.addWidget(container)
         graph_layout.addLayout(gain_layout)
@@ -271,6 +384,18 @@ class SignalAnalyzer(QMainWindow):
         self.export_button = QPushButton('导出数据', self)
         self.export_button.clicked.connect(self.exportData)
         control_layout.addWidget(self.export_button)
+        # 导入已保存的波形（.fpw或导出的CSV），按采集结果同样处理
+        self.import_button = QPushButton('导入波形', self)
+        self.import_button.clicked.connect(self.importData)
+        control_layout.addWidget(self.import_button)
+        # 当前设备的历史波形
+        self.history_button = QPushButton('历史波形', self)
+        self.history_button.clicked.connect(self.loadHistory)
+        control_layout.addWidget(self.history_button)
+        # 当前设备在当前增益下的修正参数
+        self.calibration_button = QPushButton('修正参数', self)
+        self.calibration_button.clicked.connect(self.editCalibration)
+        control_layout.addWidget(self.calibration_button)
 
         # 创建一个垂直布局用于显示计算信息
         inf_layout = QVBoxLayout()
@@ -316,14 +441,121 @@ class SignalAnalyzer(QMainWindow):
         central_widget.setLayout(main_layout)
         self.setCentralWidget(central_widget)
 
-        # 绘制波形图和FFT图
-        self.Signal()
+        # 采集线程状态
+        self.acquisition_thread = None
+        self.acquisition_worker = None
+        self.cancel_token = None
+        self.original_data = None
+        self.steady_codes = None        # 稳态采集的原始码值（平均频谱时为每次采集的），导入的波形没有
+        self.steady_filled = 0          # 稳态波形中链路丢块补点的点数，不为0时不能用于测量
+        self.spectrum = None
+        self.data = None
+        self.transient_data = np.empty(0)
+        self.transient_trigger = None
+        self.Fs = FS
+
         self.loadDevices()
+        # 窗口显示之后再开始第一次采集
+        if self.auto_capture:
+            QTimer.singleShot(0, self.Signal)
+
+    # 记录启动耗时
+    def recordStartupTime(self, stage):
+        if stage in self.startup_times:
+            return
+        self.startup_times[stage] = (time.perf_counter() - STARTUP_T0) * 1000
+        print(f'启动耗时 {stage}: {self.startup_times[stage]:.0f} ms', file=sys.stderr)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        # 事件循环处理完显示事件后视为窗口可见
+        QTimer.singleShot(0, self.onWindowShown)
+
+    def onWindowShown(self):
+        self.recordStartupTime('window_shown')
+        if self.exit_after_startup:
+            self.close()
     
+    # 创建坐标轴和持久的绘图对象，之后只更新数据
+    def setupPlots(self):
+        self.ax1[0].set_xlabel('Time/s', fontsize=8)
+        self.ax1[0].set_ylabel('电压/V', fontsize=8)
+        self.ax1[0].set_title('稳态时域波形', fontsize=10)
+        self.ax1[0].grid(True)
+        self.signal_line, = self.ax1[0].plot([], [])
+
+        self.ax1[1].set_xlabel('频率f/Hz', fontsize=8)
+        self.ax1[1].set_ylabel('电压/V', fontsize=8)
+        self.ax1[1].set_title('稳态FFT', fontsize=10)
+        self.ax1[1].set_xlim(1, FFT_XMAX)
+        self.ax1[1].grid(True)
+        self.fft_line, = self.ax1[1].plot([], [], '-c')
+        self.fft_annotations = [
+            self.ax1[1].annotate('', (0, 0), textcoords="offset points", xytext=(0,10), ha='center',
+                                 fontsize=7, visible=False)
+            for _ in range(NUM_PEAKS)]
+
+        self.ax2.set_xlabel('Time/s', fontsize=8)
+        self.ax2.set_ylabel('电压/V', fontsize=8)
+        self.ax2.set_title('瞬态波形', fontsize=10)
+        self.ax2.grid(True)
+        self.transient_line, = self.ax2.plot([], [])
+        self.mean_hline = self.ax2.axhline(y=0, color='g', linestyle='--', visible=False)
+        self.trigger_hline = self.ax2.axhline(y=0, color='r', linestyle='--', visible=False)
+        self.trigger_vline = self.ax2.axvline(x=0, color='r', linestyle='--', visible=False)
+
+        # 实时显示瞬态波形时使用blit，只重绘波形所在区域
+        self.live_data = None
+        self.live_stats = SignalStats()
+        # 当前显示的稳态、瞬态波形所用的修正参数（采集时按设备和增益选择）
+        self.steady_calibration = STEADY_CALIBRATION
+        self.transient_calibration = TRANSIENT_CALIBRATION
+        self.capture_calibration = None
+        self.transient_background = None
+        self.canvas2.mpl_connect('draw_event', self.onTransientDraw)
+
+    def setTransientYLim(self, ymin, ymax):
+        margin = 0.05*(ymax-ymin) if ymax > ymin else 0.1
+        self.ax2.set_ylim(ymin-margin, ymax+margin)
+
+    def onTransientDraw(self, event):
+        self.transient_background = self.canvas2.copy_from_bbox(self.ax2.bbox)
+        if self.transient_line.get_animated():
+            self.ax2.draw_artist(self.transient_line)
+
+    # 开始实时显示瞬态波形，显示最近length个点
+    def startLiveTransient(self, length):
+        self.live_data = RingBuffer(length)
+        self.live_ylim = None
+        self.transient_line.set_data([], [])
+        self.transient_line.set_animated(True)
+        self.mean_hline.set_visible(False)
+        self.trigger_hline.set_visible(False)
+        self.trigger_vline.set_visible(False)
+        self.ax2.set_xlim(0, length)
+        self.canvas2.draw_idle()
+
+    def updateLiveTransient(self, volts):
+        if self.live_data is None or not len(volts):
+            return
+        self.live_data.extend(volts)
+        y = self.live_data.latest(self.live_data.capacity)
+        self.transient_line.set_data(np.arange(len(y)), y)
+        ymin, ymax = np.min(volts), np.max(volts)
+        if self.live_ylim is None or ymin < self.live_ylim[0] or ymax > self.live_ylim[1]:
+            # 坐标范围变化需要整体重绘
+            lo, hi = self.live_ylim or (ymin, ymax)
+            self.live_ylim = (min(lo, ymin), max(hi, ymax))
+            self.setTransientYLim(*self.live_ylim)
+            self.canvas2.draw_idle()
+        elif self.transient_background is not None:
+            self.canvas2.restore_region(self.transient_background)
+            self.ax2.draw_artist(self.transient_line)
+            self.canvas2.blit(self.ax2.bbox)
+
     #给信号添加白噪声
     def addNoise(self, data, noise_level):
-        noise = np.random.randn(len(data)) * np.sqrt(noise_level)
-        return data + noise
+        return add_noise(data, noise_level)
     
 
     #调整增益
@@ -370,341 +602,355 @@ class SignalAnalyzer(QMainWindow):
             self.time_dalay-=1
             self.plotSignal()
 
-    def Signal(self):
-        global NUM_SAMPLES
+    # 在后台线程中运行采集，结果通过信号回到界面线程
+    def startAcquisition(self, mode, **options):
+        if self.acquisition_thread is not None:
+            return False
+        self.cancel_token = CancelToken()
+        self.capture_calibration = options.setdefault('calibration', self.calibrationFor(mode))
+        self.acquisition_thread = QThread(self)
+        self.timer.begin(mode)
+        self.acquisition_worker = AcquisitionWorker(mode, self.serial_session, self.cancel_token,
+                                                    self.timer if self.timer.enabled else None, **options)
+        self.acquisition_worker.moveToThread(self.acquisition_thread)
+        self.acquisition_thread.started.connect(self.acquisition_worker.run)
+        self.acquisition_worker.progress.connect(self.onAcquisitionProgress)
+        self.acquisition_worker.partial.connect(self.onAcquisitionPartial)
+        self.acquisition_worker.finished.connect(self.onAcquisitionFinished)
+        self.acquisition_worker.failed.connect(self.onAcquisitionFailed)
+        self.acquisition_worker.done.connect(self.acquisition_thread.quit)
+        self.acquisition_thread.finished.connect(self.onAcquisitionThreadFinished)
         self.led.set_state(1)
-        QApplication.processEvents()
-
-        #串口初始化
-        portx="/dev/ttyAMA0"
-        bps=115200
-        timex=0.1
-        ser=serial.Serial(portx,bps,timeout=timex)
-        if ser.isOpen():
-            print("open success")
-            print("串口详情参数：", ser)
-            print(ser.port)#获取到当前打开的串口名
-            print(ser.baudrate)#获取波特率
+        self.live_stats = SignalStats()     # 采集过程中的实时统计，不保存数据
+        if mode == 'transient':
+            self.startLiveTransient(PIPELINE_DELAY + TRANSIENT_SAMPLES)
+        elif mode == 'continuous':
+            self.startLiveTransient(options['pre_trigger'] + options['post_trigger'])
+        self.acquisition_thread.start()
+        return True
+
+    def onAcquisitionProgress(self, got, total):
+        stats = self.live_stats
+        live = f'  均值 {stats.mean:.4f}V 纹波有效值 {stats.rms:.4f}V' if stats.count else ''
+        if total:
+            self.statusBar().showMessage(f'采集中 {got}/{total}{live}')
         else:
-            print("open failed")
-
-        NUM_SAMPLES = 60000
-        self.Fs = 600000
-        f1 = 125
-        f2 = 1200
-        f3 = 3005
-        f4 = 5000
-        t = np.linspace(0, 0.15, 90000)
-        data_to_send=1.5+0.3*np.sin(2*np.pi*f1*t)+0.1*np.sin(2*np.pi*f2*t)\
-                    +0.1*np.sin(2*np.pi*f3*t)+0.05*np.sin(2*np.pi*f4*t)\
-                     +0.1*np.sin(2*np.pi*10000*t)+0.05*np.sin(2*np.pi*20000*t)
-        data_to_send = self.addNoise(data_to_send, 0.001)   #添加白噪声
-
-        # 发送数据
-        for value in data_to_send:
-            # 将浮点数转换为整数
-            value=value/0.935-1.095
-            if (value>0):
-                int_value= int(4096-value/5*2048)
-            else: int_value= int(-value/5*2048)
-            int_value = 4095-int_value
-            # 将整数转换为字节，并发送
-            ser.write(int_value.to_bytes(2, byteorder='big'))
-
-        # 读取串口数据并保存到数组中
-        data = []
-        for _ in range(NUM_SAMPLES+120):
-            bytes = ser.read(2)
-            if bytes[0]>0x0F:
-                bytes = ser.read(1)
-                bytes = ser.read(2)
-            # 将接收到的字节转换为整数
-            value = int.from_bytes(bytes, byteorder='big')  # 读取字节数组并转换为整数 
-            value = 4095-value
-            #original_value = (2048 - value) / 2048 * 5   #转换为原始数据
-            if (value>2048):
-                original_value= (4096-value)/2048*5
-            else: original_value= -value*5/2048
-            original_value = (original_value+1.095)*0.935 #数据修正
-            data.append(original_value)
-        data=data[120:]
-
-        # 关闭串口    
-        ser.close()
+            self.statusBar().showMessage(f'连续采集中，已接收 {got} 点，等待触发{live}')
+
+    def onAcquisitionPartial(self, mode, volts):
+        self.led.set_state(1)
+        self.live_stats.update(volts)
+        if mode in ('transient', 'continuous'):
+            self.updateLiveTransient(volts)
+
+    def onAcquisitionFinished(self, mode, result):
+        self.recordStartupTime('first_capture')
         self.led.set_state(2)
-        self.original_data=data
-        
-        self.signal_gain()
+        # 有链路错误时在状态栏显示（重同步、坏块和补点的块数）
+        link_stats = self.serial_session.link_stats
+        if link_stats.errors or link_stats.filled:
+            self.statusBar().showMessage(link_stats.summary())
+        else:
+            self.statusBar().clearMessage()
+        calibration = self.capture_calibration or self.calibrationFor(mode)
+        # 有补点的采集在历史波形中标记补点的点数
+        filled = {'filled': link_stats.filled} if link_stats.filled else {}
+        if mode == 'steady':
+            if result is None:
+                self.scheduleTimingFinish()     # 取消的采集也结束本次计时
+                return
+            self.original_data, codes = result
+            self.steady_codes = [codes]
+            self.steady_calibration = calibration
+            self.steady_filled = link_stats.filled
+            with self.timer.stage('fft', len(self.original_data)):
+                self.spectrum = analyze_spectrum(self.original_data, self.Fs)
+            self.signal_gain()
+            self.saveHistory(mode, self.original_data, self.steady_calibration, gain=self.gain, **filled)
+        elif mode == 'averaged':
+            if result is None:
+                self.scheduleTimingFinish()     # 取消的采集也结束本次计时
+                return
+            self.original_data, self.spectrum, self.steady_codes = result
+            self.steady_calibration = calibration
+            self.steady_filled = link_stats.filled
+            self.signal_gain()
+            self.saveHistory(mode, self.original_data, self.steady_calibration, gain=self.gain, **filled)
+        else:
+            self.live_data = None
+            self.transient_calibration = calibration
+            with self.timer.stage('transient_plot', len(result[0])):
+                self.plotTransientSignal(*result)
+            self.saveHistory(mode, result[0], self.transient_calibration, trigger_index=result[2], **filled)
+        self.scheduleTimingFinish()
+
+    # 重绘请求在事件循环中排队，再排队一次，使计时包含本次操作触发的重绘
+    def scheduleTimingFinish(self):
+        if self.timer.operation is not None:
+            QTimer.singleShot(0, lambda: QTimer.singleShot(0, self.finishTiming))
+
+    # 没有进行中的操作时（如单独切换增益、计算测量值），开始一次新的计时操作
+    def beginTiming(self, operation):
+        if self.timer.enabled and self.timer.operation is None:
+            self.timer.begin(operation)
+            self.scheduleTimingFinish()
+
+    def finishTiming(self):
+        summary = self.timer.finish()
+        if summary is not None:
+            self.statusBar().showMessage(summary)
+
+    # 选择了设备时，把采集到的波形保存到该设备的历史波形中
+    def saveHistory(self, mode, data, calibration, gain=1, **extra):
+        if self.current_device is None or not len(data):
+            return
+        self.history.add(self.current_device, mode, data, self.Fs, gain, calibration, **extra)
+
+    # 显示读取的波形（导入的文件或历史波形），与采集结果同样分析和绘图
+    # calibration: 波形文件中记录的修正参数，没有时为默认参数；filled: 历史波形中补点的点数
+    # gain: 文件头中记录的增益（与csv_import.reanalyze相同），稳态波形按该增益显示，
+    # 导出的CSV中已是增益后的数据，增益为1
+    def showWaveform(self, kind, data, fs, trigger_index=None, calibration=None, filled=0, gain=1):
+        if kind in ('transient', 'continuous'):
+            self.transient_calibration = calibration or TRANSIENT_CALIBRATION
+            data = data * gain
+            self.plotTransientSignal(data, np.mean(data), trigger_index)
+        else:
+            # 数据太短或有无效值时analyze_spectrum引发ValueError，保留当前显示的波形
+            spectrum = analyze_spectrum(data, fs)
+            self.steady_calibration = calibration or STEADY_CALIBRATION
+            self.original_data = data
+            self.steady_codes = None
+            self.steady_filled = filled
+            self.spectrum = spectrum
+            self.gain = gain
+            self.signal_gain()
+
+    def onAcquisitionFailed(self, message):
+        self.timer.finish()
+        self.led.set_state(2)
+        self.live_data = None
+        self.transient_line.set_animated(False)
+        self.statusBar().showMessage(f'采集失败: {message}')
+
+    def onAcquisitionThreadFinished(self):
+        self.acquisition_thread.deleteLater()
+        self.acquisition_worker.deleteLater()
+        self.acquisition_thread = None
+        self.acquisition_worker = None
+
+    def Signal(self):
+        captures = self.average_spin.value()
+        if captures > 1:
+            self.startAcquisition('averaged', captures=captures, keep_codes=True)
+        else:
+            self.startAcquisition('steady', keep_codes=True)
 
     def signal_gain(self):
+        if self.original_data is None:
+            return
+        self.beginTiming('gain')
+        self.recalibrate()
         # 处理信号增益
-        self.data = [x * self.gain for x in self.original_data]
-        self.FFTplot()
-        self.plotSignal()
+        with self.timer.stage('gain', len(self.original_data)):
+            self.data = self.original_data * self.gain
+        with self.timer.stage('fft_plot'):
+            self.FFTplot()
+        with self.timer.stage('plot', len(self.data)):
+            self.plotSignal()
+
+    # 采集的码值按当前增益的修正参数重新换算（查表）；参数与采集时相同时不重新计算频谱
+    def recalibrate(self):
+        if self.steady_codes is None:
+            return
+        calibration = self.calibrationFor('steady')
+        if calibration_key(calibration) == calibration_key(self.steady_calibration):
+            return
+        with self.timer.stage('calibration', sum(len(codes) for codes in self.steady_codes)):
+            captures = [codes_to_volts(codes, calibration) for codes in self.steady_codes]
+            self.original_data = captures[-1]
+            self.steady_calibration = calibration
+        with self.timer.stage('fft', len(self.original_data)):
+            if len(captures) > 1:
+                self.spectrum = averaged_spectrum(captures, self.Fs)
+            else:
+                self.spectrum = analyze_spectrum(self.original_data, self.Fs)
 
     def FFTplot(self):
-        # 计算FFT
-        mean = np.mean(self.data)
-        self.data=[x-mean for x in self.data]  #去直流分量
-        self.data = self.data + [0.0] * 60000   # 补零
-        N = len(self.data)
-        fft_data = fft(self.data)
-        abs_data = np.abs(fft_data)
-        normalization_data = abs_data / N
-        normalization_data[1:N // 2] *= 4   #归一化修正
-        normalization_half_data = normalization_data[range(int(N / 2))]
-        half_fx = np.fft.fftfreq(len(self.data), 1 / self.Fs)[:len(self.data) // 2]
-
-        # 找到最大的数值及其索引，只取极点
-        indices = np.argsort(normalization_half_data)[-50:][::-1]  # 从大到小排序取前100个索引
-        top_indices = np.zeros(5, dtype=int)
-        n = 0
-        ind = 1
-
-        while n < 5 and ind < len(indices) - 1:
-            # 检查是否是极点
-            if (normalization_half_data[indices[ind]] > normalization_half_data[indices[ind]-1] and
-                    normalization_half_data[indices[ind]] > normalization_half_data[indices[ind]+1]):
-                top_indices[n] = indices[ind]
-                n += 1
-            ind += 1
-
-        self.top_values = normalization_half_data[top_indices]
-        self.top_frequencies = half_fx[top_indices]
-
-        # 绘制FFT图
-        self.ax1[1].clear()
-        self.ax1[1].set_xlabel('频率f/Hz', fontsize=8)
-        self.ax1[1].set_ylabel('电压/V', fontsize=8)
-        self.ax1[1].set_title('稳态FFT', fontsize=10)
-        self.ax1[1].plot(half_fx, normalization_half_data, '-c')
-        self.ax1[1].set_xlim(1, 5000)
-        self.ax1[1].grid(True)
+        # 频谱按采集缓存，改变增益时只做线性缩放
+        spectrum = self.spectrum.scaled(self.gain)
+        # 频谱为空或有无效值时不绘制，坐标范围不能为NaN
+        if not len(spectrum.magnitude) or not np.isfinite(spectrum.magnitude).all():
+            self.top_values = self.top_frequencies = np.empty(0)
+            self.fft_line.set_data([], [])
+            for annotation in self.fft_annotations:
+                annotation.set_visible(False)
+            self.canvas1.draw_idle()
+            return
+        half_fx = spectrum.freqs
+        normalization_half_data = spectrum.magnitude
+        self.top_values = spectrum.top_values
+        self.top_frequencies = spectrum.top_frequencies
+
+        # 更新FFT图，只把可见频段交给matplotlib
+        visible = half_fx <= FFT_XMAX
+        self.fft_line.set_data(half_fx[visible], normalization_half_data[visible])
+        ymax = normalization_half_data.max()
+        self.ax1[1].set_ylim(-0.05*ymax, 1.05*ymax)
 
         # 在图形上标记点
-        for index, value, freq in zip(top_indices, self.top_values, self.top_frequencies):
-            self.ax1[1].annotate(f'({freq:.0f},{value:.2f})',(freq, value)
-                                 , textcoords="offset points", xytext=(0,10), ha='center',fontsize=7)
-        self.canvas1.draw()
-        self.data=self.data[:-60000]    #去掉补零的部分
-        self.data=[x+mean for x in self.data]   #加上直流分量
+        for annotation in self.fft_annotations:
+            annotation.set_visible(False)
+        for annotation, value, freq in zip(self.fft_annotations, self.top_values, self.top_frequencies):
+            annotation.xy = (freq, value)
+            annotation.set_text(f'({freq:.0f},{value:.2f})')
+            annotation.set_visible(True)
+        self.canvas1.draw_idle()
 
     #绘制波形和FFT图
     def plotSignal(self):
-        # 绘制波形图
-        self.ax1[0].clear()
-        self.ax1[0].set_xlabel('Time/s', fontsize=8)
-        self.ax1[0].set_ylabel('电压/V', fontsize=8)
-        self.ax1[0].set_title('稳态时域波形', fontsize=10)
+        if self.data is None:
+            return
+        # 更新波形图
         data_base=NUM_SAMPLES//128*self.time_base
-        self.ax1[0].set_xlim(self.time_dalay*data_base//20,self.time_dalay*data_base//20+data_base)
-        self.ax1[0].plot(range(NUM_SAMPLES),self.data[:NUM_SAMPLES])
-        self.ax1[0].set_ylim(-5,)
-        self.ax1[0].grid(True)
-        # 重绘画布
-        self.canvas1.draw()
+        start=self.time_dalay*data_base//20
+        self.ax1[0].set_xlim(start,start+data_base)
+        # 只取可见窗口，并按画布像素宽度做最小/最大值降采样
+        x, y = minmax_envelope(self.data[:NUM_SAMPLES], start, start+data_base, self.ax1[0].bbox.width)
+        self.signal_line.set_data(x, y)
+        ymax = np.max(self.data) if len(self.data) else 0
+        self.ax1[0].set_ylim(-5, ymax + 0.05*(ymax+5))
+        # 重绘请求会合并，同一事件中只重绘一次
+        self.canvas1.draw_idle()
 
     def start_transient_signal(self):
-        self.led.set_state(1)
-        QApplication.processEvents()
-
-        self.if_stop = False
-
-        #串口初始化
-        portx="/dev/ttyAMA0"
-        bps=115200
-        timex=0.1
-        ser=serial.Serial(portx,bps,timeout=timex)
-
-        f1 = 100
-        f2 = 1200
-        f3 = 3000
-        f4 = 5000
-        t = np.linspace(0, 1, 60000)
-        data_to_send=1.5+0.3*np.sin(2*np.pi*f1*t)+0.1*np.sin(2*np.pi*f2*t)\
-                    +0.1*np.sin(2*np.pi*f3*t)+0.05*np.sin(2*np.pi*f4*t)\
-                     +0.1*np.sin(2*np.pi*10000*t)+0.05*np.sin(2*np.pi*20000*t)
-        data_to_send = self.addNoise(data_to_send, 0.001)   #添加白噪声
-
-        # 发送数据
-        for value in data_to_send:
-            # 将浮点数转换为整数
-            int_value = int((1-value/5) *2048)  # 将范围从 (-5, 5) 映射到 (0, 4095)
-            int_value = 4095-int_value
-            # 将整数转换为字节，并发送
-            ser.write(int_value.to_bytes(2, byteorder='big'))
-
-        # 读取串口数据并保存到数组中
-        data = []
-        stop_num = 120+20000
-        mean_data = 0
-        for _ in range(120+20000):
-            if self.if_stop:
-                break
-            if _ == stop_num:
-                break
-            bytes = ser.read(2)
-            if bytes[0]>0x0F:
-                bytes = ser.read(1)
-                bytes = ser.read(2)
-            value = int.from_bytes(bytes, byteorder='big')
-            value = 4095-value
-            if (value>2048):
-                original_value= (4096-value)/2048*5
-            else: original_value= -value*5/2048
-            original_value = (original_value+1.295)*0.866667 #数据修正
-            data.append(original_value)
-            #当已经记录120个数据时取平均数并判断触发条件
-            if _>120:
-                mean_data=np.mean(data[20:])
-                if (abs(original_value-mean_data)>abs(0.3*mean_data)):
-                    if stop_num==20120:
-                        stop_num=_+100
-                    print(mean_data,' ',abs(original_value-mean_data),' ',abs(0.1*mean_data),' ',stop_num)
-
-        data=data[20:]
+        if self.continuous_check.isChecked():
+            self.startAcquisition('continuous', pre_trigger=self.pre_trigger_spin.value(),
+                                  post_trigger=self.post_trigger_spin.value())
+        else:
+            self.startAcquisition('transient')
+
+    def plotTransientSignal(self, data, mean_data, trigger_index):
         self.transient_data = data
+        self.transient_trigger = trigger_index
+        if not len(self.transient_data):
+            return
 
-        # 关闭串口    
-        ser.close()
+        # 更新暂态波形图
+        self.transient_line.set_animated(False)
+        self.transient_line.set_data(np.arange(len(self.transient_data)), self.transient_data)
+        self.ax2.set_xlim(0, len(self.transient_data))
+        self.setTransientYLim(np.min(self.transient_data), np.max(self.transient_data))
+        # 绘制一条绿色的 y=mean_data 的虚线
+        self.mean_hline.set_ydata([mean_data, mean_data])
+        self.mean_hline.set_visible(True)
+        # 手动停止时可能还未到达触发点
+        if trigger_index is not None:
+            trigger_index = min(trigger_index, len(self.transient_data)-1)
+            trigger_value = self.transient_data[trigger_index]
+            self.trigger_hline.set_ydata([trigger_value, trigger_value])
+            # 绘制一条经过触发点的红色虚线
+            self.trigger_vline.set_xdata([trigger_index, trigger_index])
+        self.trigger_hline.set_visible(trigger_index is not None)
+        self.trigger_vline.set_visible(trigger_index is not None)
 
-        # 绘制暂态波形图
-        self.ax2.clear()
-        self.ax2.set_xlabel('Time/s', fontsize=8)
-        self.ax2.set_ylabel('电压/V', fontsize=8)
-        self.ax2.set_title('瞬态波形', fontsize=10)
-        self.ax2.plot(range(len(self.transient_data)), self.transient_data)
-        self.ax2.grid(True)
-        # 绘制一条红色的 y=mean_data 的虚线
-        self.ax2.axhline(y=mean_data, color='g', linestyle='--')
-        self.ax2.axhline(y=self.transient_data[stop_num-120], color='r', linestyle='--')
-        # 绘制一条经过第 stop_num-100 个点的红色虚线
-        self.ax2.axvline(x=stop_num-120, color='r', linestyle='--')
-        self.led.set_state(2)
-        
         # 重绘画布
-        self.canvas2.draw()
+        self.canvas2.draw_idle()
 
-        
     def stop_transient_signal(self):
-        self.if_stop = True
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+
+    # 关闭窗口时取消并等待正在进行的采集
+    def closeEvent(self, event):
+        if self.acquisition_thread is not None:
+            self.cancel_token.cancel()
+            self.acquisition_thread.quit()
+            self.acquisition_thread.wait()
+        self.serial_session.close()
+        self.devices.close()
+        self.history.close()
+        super().closeEvent(event)
     
     def save_transient_signal(self):
-        file_name, _ = QFileDialog.getSaveFileName(self, '导出数据', '', 'CSV Files (*.csv)')
+        file_name, _ = QFileDialog.getSaveFileName(self, '导出数据', '', EXPORT_FILTER)
         if self.current_device is None:
             QMessageBox.warning(self, '警告', '请先选择一个设备')
             return
-        if file_name:
-            with open(file_name, 'w', newline='') as file:
-                writer = csv.writer(file)
-                # 写入设备名称
-                writer.writerow(['Transient Signal Data'])
-                writer.writerow(['Device'])
-                writer.writerow([self.current_device])
-            
-                # 写入波形数据
-                writer.writerow(['\n dataset:'])
-                writer.writerow(['index','value/V'])
-                for idx, val in enumerate(self.transient_data):
-                    writer.writerow([idx,val])
+        if file_name and not file_name.lower().endswith('.csv'):
+            # 二进制波形文件
+            save_waveform(exportPath(file_name), self.transient_data, self.current_device, 'transient',
+                          self.Fs, calibration=self.transient_calibration, trigger_index=self.transient_trigger)
+        elif file_name:
+            write_capture_csv(file_name, self.transient_data, self.current_device, kind='transient')
+
+    def importData(self):
+        file_name, _ = QFileDialog.getOpenFileName(self, '导入波形', '',
+                                                   f'Waveform Files (*{WAVEFORM_SUFFIX} *.csv)')
+        if not file_name:
+            return
+        try:
+            header, data = load_capture(file_name)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, '警告', f'无法读取波形文件: {e}')
+            return
+        if not len(data):
+            QMessageBox.warning(self, '警告', '波形文件中没有数据')
+            return
+        try:
+            self.showWaveform(header['kind'], data, header.get('fs', self.Fs), header.get('trigger_index'),
+                              header.get('calibration'), gain=header.get('gain', 1))
+        except ValueError as e:
+            QMessageBox.warning(self, '警告', f'无法分析波形: {e}')
+            return
+        self.statusBar().showMessage(f'已导入 {os.path.basename(file_name)}（{len(data)} 点）')
+
+    # 从当前设备的历史波形中选择一次采集显示
+    def loadHistory(self):
+        if self.current_device is None:
+            QMessageBox.warning(self, '警告', '请先选择一个设备')
+            return
+        captures = self.history.list(self.current_device)
+        if not captures:
+            QMessageBox.warning(self, '警告', '该设备没有历史波形')
+            return
+        items = [f"#{c['id']}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(c['created']))}  {c['mode']}  {c['count']} 点"
+                 + (f"（补点 {c['filled']}）" if c.get('filled') else '')
+                 for c in captures]
+        item, ok = QInputDialog.getItem(self, '历史波形', '选择一次采集:', items, 0, False)
+        if not ok:
+            return
+        info, data = self.history.load(captures[items.index(item)]['id'])
+        try:
+            self.showWaveform(info['mode'], data, info['fs'], info.get('trigger_index'), info['calibration'],
+                              info.get('filled', 0), info['gain'])
+        except ValueError as e:
+            QMessageBox.warning(self, '警告', f'无法分析波形: {e}')
+            return
+        self.statusBar().showMessage(f'历史波形 {item}')
 
     def showSignalInfo(self, mode):
         if self.current_device is None:
             QMessageBox.warning(self, '警告', '请先选择一个设备')
             return 
+        if self.data is None:
+            QMessageBox.warning(self, '警告', '请先获取稳态波形')
+            return
+        if mode != 'clear' and self.steady_filled:
+            # 丢块处重复上一个码值补点，会使纹波幅值和统计值偏小
+            QMessageBox.warning(self, '警告', f'该波形中有 {self.steady_filled} 个链路丢块的补点，不能用于测量，请重新采集')
+            return
 
-        # 波峰值、波谷值、有效值、平均值计算
-        peak_voltage = np.max(self.data)
-        trough_voltage = np.min(self.data)
-        mean_voltage = np.mean(self.data)
-        rms_voltage = np.sqrt(np.mean(np.array(self.data)**2)) - mean_voltage
-
-        #信噪比计算
-        noise_power = np.mean(np.array((self.data - np.mean(self.data)))**2)
-        signal_power = np.mean(np.array(self.data)**2)
-        snr = 10 * np.log10(signal_power / noise_power)
-        #筛选出FFT结果最大的信号频率
+        self.beginTiming(f'measure {mode}')
+        if mode == 'clear':  # 清零
+            metrics = None
+        else:
+            with self.timer.stage('metrics', len(self.data)):
+                metrics = signal_metrics(self.data, self.spectrum.scaled(self.gain))
+        # 只读改写当前设备的记录
+        self.saveDevice(self.current_device, lambda record: record_measurement(record, mode, metrics))
         # 更新UI
-        if mode == 'unloaded':  # 空载
-            self.unloaded_peak_voltage_edit.setText(f'{peak_voltage:.2f} V')
-            self.unloaded_trough_voltage_edit.setText(f'{trough_voltage:.2f} V')
-            self.unloaded_rms_voltage_edit.setText(f'{rms_voltage:.2f} V')
-            self.unloaded_mean_voltage_edit.setText(f'{mean_voltage:.2f} V')
-            self.unloaded_snr_edit.setText(f'{snr:.2f} dB')
-            self.unloaded_ripple_freq_edit.setText(
-                f"freq= {self.top_frequencies[0]:.2f} Hz, 幅值= {self.top_values[0]:.2f} V\n"
-                f"freq= {self.top_frequencies[1]:.2f} Hz, 幅值= {self.top_values[1]:.2f} V\n"
-                f"freq= {self.top_frequencies[2]:.2f} Hz, 幅值= {self.top_values[2]:.2f} V"
-            )
-
-            # 保存数据
-            self.devices[self.current_device]['unloaded'] = {
-                'peak_voltage': peak_voltage,
-                'trough_voltage': trough_voltage,
-                'rms_voltage': rms_voltage,
-                'mean_voltage': mean_voltage,
-                'snr': snr,
-                'ripple_frequencies': self.top_frequencies[0:].tolist(),
-                'ripple_amplitudes': self.top_values[0:].tolist()
-            }
-        elif mode == 'loaded':  #满载
-            self.loaded_peak_voltage_edit.setText(f'{peak_voltage:.2f} V')
-            self.loaded_trough_voltage_edit.setText(f'{trough_voltage:.2f} V')
-            self.loaded_rms_voltage_edit.setText(f'{rms_voltage:.2f} V')
-            self.loaded_mean_voltage_edit.setText(f'{mean_voltage:.2f} V')
-            self.loaded_snr_edit.setText(f'{snr:.2f} dB')
-            self.loaded_ripple_freq_edit.setText(
-                f"freq= {self.top_frequencies[0]:.2f} Hz, 幅值= {self.top_values[0]:.2f} V\n"
-                f"freq= {self.top_frequencies[1]:.2f} Hz, 幅值= {self.top_values[1]:.2f} V\n"
-                f"freq= {self.top_frequencies[2]:.2f} Hz, 幅值= {self.top_values[2]:.2f} V"
-            )
-
-            self.devices[self.current_device]['loaded'] = {
-                'peak_voltage': peak_voltage,
-                'trough_voltage': trough_voltage,
-                'rms_voltage': rms_voltage,
-                'mean_voltage': mean_voltage,
-                'snr': snr,
-                'ripple_frequencies': self.top_frequencies[0:].tolist(),
-                'ripple_amplitudes': self.top_values[0:].tolist()
-            }
-        elif mode == 'min_max_voltage': # 电压调节范围计算
-            max_voltage = self.max_voltage_edit.text()
-            min_voltage = self.min_voltage_edit.text()
-            if max_voltage : max_voltage = float(max_voltage.split(' ')[0])
-            else : max_voltage = -10
-            if min_voltage : min_voltage = float(min_voltage.split(' ')[0])
-            else : min_voltage = 10
-            max_voltage = max(max_voltage, peak_voltage)
-            min_voltage = min(min_voltage, trough_voltage)
-            voltage_range = max_voltage - min_voltage
-            self.max_voltage_edit.setText(f'{max_voltage:.2f} V')
-            self.min_voltage_edit.setText(f'{min_voltage:.2f} V')
-            self.voltage_range_edit.setText(f'{voltage_range:.2f} V')
-            self.devices[self.current_device]['min_max_range'] = {
-                'max_voltage': max_voltage,
-                'min_voltage': min_voltage,
-                'voltage_range': voltage_range
-            }
-        elif mode == 'clear':  # 清零
-            self.max_voltage_edit.setText(f"")
-            self.min_voltage_edit.setText(f"")
-            self.voltage_range_edit.setText(f"")
-            self.devices[self.current_device]['min_max_range'] = {}
-            
-        # 计算电压相对负载调整率为（满载-空载）/空载*100%
-        loaded_mean=self.loaded_mean_voltage_edit.text()
-        unloaded_mean=self.unloaded_mean_voltage_edit.text()
-        if loaded_mean and unloaded_mean:
-            loaded_mean = float(loaded_mean.split(' ')[0])
-            unloaded_mean = float(unloaded_mean.split(' ')[0])
-            voltage_adjustment_rate = abs(loaded_mean - unloaded_mean) / unloaded_mean * 100
-            self.voltage_adjustment_rate_edit.setText(f'{voltage_adjustment_rate:.2f}%')
-            self.devices[self.current_device]['carculation_results'] = {
-                'voltage_adjustment_rate': voltage_adjustment_rate
-        }
-
-        self.saveDevices()  # 保存数据
+        self.loadDeviceData()
 
     #添加设备
     def addDevice(self):
@@ -713,14 +959,14 @@ class SignalAnalyzer(QMainWindow):
             if device_name in self.devices:
                 QMessageBox.warning(self, '警告', '设备已存在')
             else:
-                self.devices[device_name] = {'unloaded': {}, 'loaded': {}}
+                self.devices.put(device_name, {'unloaded': {}, 'loaded': {}})
                 self.device_select.addItem(device_name)
                 self.device_select.setCurrentText(device_name)
-                self.saveDevices()
 
     #加载设备数据
     def loadDeviceData(self):
         device_name = self.device_select.currentText()
+        device = self.devices.get(device_name)   # 只读取当前设备的记录
         if device_name == "选择设备":
             # 清空数据
             self.current_device = None
@@ -742,10 +988,10 @@ class SignalAnalyzer(QMainWindow):
             self.max_voltage_edit.setText(f"")
             self.voltage_range_edit.setText(f"")
 
-        elif device_name in self.devices:
+        elif device is not None:
             self.current_device = device_name
-            unloaded = self.devices[device_name].get('unloaded', {})
-            loaded = self.devices[device_name].get('loaded', {})
+            unloaded = device.get('unloaded', {})
+            loaded = device.get('loaded', {})
             # 读取文件中保存的设备数据
             self.unloaded_peak_voltage_edit.setText(f"{unloaded.get('peak_voltage', ''):.2f} V" if unloaded else "")
             self.unloaded_trough_voltage_edit.setText(f"{unloaded.get('trough_voltage', ''):.2f} V" if unloaded else "")
@@ -767,93 +1013,90 @@ class SignalAnalyzer(QMainWindow):
             self.loaded_ripple_freq_edit.setText(
                 '\n'.join([f"freq= {freq:.2f} Hz, 幅值= {amp:.2f} V" for freq, amp in zip(ripple_frequencies, ripple_amplitudes)]))
             
-            min_max_range = self.devices[device_name].get('min_max_range', {})
+            min_max_range = device.get('min_max_range', {})
             self.min_voltage_edit.setText(f"{min_max_range.get('min_voltage', ''):.2f} V" if min_max_range else "")
             self.max_voltage_edit.setText(f"{min_max_range.get('max_voltage', ''):.2f} V" if min_max_range else "")
             self.voltage_range_edit.setText(f"{min_max_range.get('voltage_range', ''):.2f} V" if min_max_range else "")
             
-            info = self.devices[device_name].get('carculation_results', {})
+            info = device.get('carculation_results', {})
             self.voltage_adjustment_rate_edit.setText(f"{info.get('voltage_adjustment_rate', ''):.2f}%" if info else "")
             
-    # 保存设备文件
-    def saveDevices(self):
-        with open('devices.json', 'w') as file:
-            json.dump(self.devices, file)
+    # 保存单个设备的数据：update(记录) 在同一事务中修改该设备的记录
+    def saveDevice(self, device_name, update):
+        with self.timer.stage('save_device'):
+            return self.devices.update(device_name, update)
+
+    # 按当前设备和增益选择采集使用的修正参数，没有选择设备或没有保存参数时为默认参数
+    def calibrationFor(self, mode):
+        record = self.devices.get(self.current_device) if self.current_device is not None else None
+        return select_profile(record, mode, self.gain)
+
+    # 修改当前设备在当前增益下的线性修正参数 (v + 偏移) * 比例，下次采集时生效
+    def editCalibration(self):
+        if self.current_device is None:
+            QMessageBox.warning(self, '警告', '请先选择一个设备')
+            return
+        mode, ok = QInputDialog.getItem(self, '修正参数', '采集模式:', ['steady', 'transient'], 0, False)
+        if not ok:
+            return
+        offset, scale, points = calibration_key(self.calibrationFor(mode))
+        if points:
+            QMessageBox.warning(self, '警告', '当前为分段修正参数，请用 calibration.py 修改')
+            return
+        title = f'修正参数（{mode}，增益 {gain_key(self.gain)}）'
+        offset, ok = QInputDialog.getDouble(self, title, '偏移:', offset, -100, 100, 6)
+        if not ok:
+            return
+        scale, ok = QInputDialog.getDouble(self, title, '比例:', scale, -100, 100, 6)
+        if not ok:
+            return
+        profile = {'offset': offset, 'scale': scale}
+        self.saveDevice(self.current_device, lambda record: set_profile(record, mode, self.gain, profile))
+        self.statusBar().showMessage(f'已保存{title}: 偏移 {offset:g} 比例 {scale:g}')
 
-    # 加载设备文件
+    # 打开设备数据库（首次运行时导入devices.json），只读取设备名称
     def loadDevices(self):
-        if os.path.exists('devices.json'):
-            with open('devices.json', 'r') as file:
-                self.devices = json.load(file)
-                self.device_select.addItems(self.devices.keys())
+        self.devices = DeviceStore()
+        self.history = WaveformHistory()
+        self.device_select.addItems(self.devices.names())
 
     # 输出数据为csv文件 
     def exportData(self):
         if self.current_device is None:
             QMessageBox.warning(self, '警告', '请先选择一个设备')
             return
+        if self.data is None:
+            QMessageBox.warning(self, '警告', '请先获取稳态波形')
+            return
 
-        file_name, _ = QFileDialog.getSaveFileName(self, '导出数据', '', 'CSV Files (*.csv)')
-        if file_name:
-            device_data = self.devices[self.current_device]
-            with open(file_name, 'w', newline='') as file:
-                writer = csv.writer(file)
-                # 写入设备名称
-                writer.writerow(['Device'])
-                writer.writerow([self.current_device])
-                # 写入表头
-                writer.writerow(['Mode', 'Peak Voltage (V)', 'Trough Voltage (V)', 'RMS Voltage (V)'
-                                 , 'Mean Voltage (V)', 'SNR (dB)', 'Ripple Frequencies (Hz)'
-                                 , 'Ripple Amplitudes (V)'])
-                # 写入空载和满载数据
-                unloaded = device_data.get('unloaded', {})
-                loaded = device_data.get('loaded', {})
-                if unloaded:
-                    writer.writerow([
-                        'Unloaded',
-                        unloaded.get('peak_voltage', ''),
-                        unloaded.get('trough_voltage', ''),
-                        unloaded.get('rms_voltage', ''),
-                        unloaded.get('mean_voltage', ''),
-                        unloaded.get('snr', ''),
-                        ', '.join([f"{freq:.0f}" for freq in unloaded.get('ripple_frequencies', [])]),
-                        ', '.join([f"{amp:.2f}" for amp in unloaded.get('ripple_amplitudes', [])])
-                    ])
-                if loaded:
-                    writer.writerow([
-                        'Loaded',
-                        loaded.get('peak_voltage', ''),
-                        loaded.get('trough_voltage', ''),
-                        loaded.get('rms_voltage', ''),
-                        loaded.get('mean_voltage', ''),
-                        loaded.get('snr', ''),
-                        ', '.join([f"{freq:.0f}" for freq in loaded.get('ripple_frequencies', [])]),
-                        ', '.join([f"{amp:.2f}" for amp in loaded.get('ripple_amplitudes', [])])
-                    ])
-                writer.writerow(['Min(v)','Max(v)','Min-Max Voltage Range(v)'])
-                min_max_range = device_data.get('min_max_range', {})
-                if min_max_range:
-                    writer.writerow([
-                        min_max_range.get('min_voltage', ''),
-                        min_max_range.get('max_voltage', ''),
-                        min_max_range.get('voltage_range', '')
-                    ])
-                writer.writerow(['Voltage Adjustment Rate(%)'])
-                info = device_data.get('carculation_results', {})
-                if info:
-                    writer.writerow([
-                        info.get('voltage_adjustment_rate', '')
-                    ])
-
-                # 写入波形数据
-                writer.writerow(['\n dataset:'])
-                writer.writerow(['index','value/V'])
-                for idx, val in enumerate(self.data):
-                    writer.writerow([idx,val])
-
+        file_name, _ = QFileDialog.getSaveFileName(self, '导出数据', '', EXPORT_FILTER)
+        device_data = self.devices.get(self.current_device) or {}
+        if file_name and not file_name.lower().endswith('.csv'):
+            # 二进制波形文件：保存增益前的数据和增益，附带设备测量结果
+            save_waveform(exportPath(file_name), self.original_data, self.current_device, 'steady',
+                          self.Fs, self.gain, self.steady_calibration, measurements=device_data)
+        elif file_name:
+            write_capture_csv(file_name, self.data, self.current_device, device_data)
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    ex = SignalAnalyzer()
+    parser = argparse.ArgumentParser(description='Signal Analyzer')
+    parser.add_argument('--port', default=DEFAULT_PORT, help='串口名')
+    parser.add_argument('--baudrate', type=int, default=DEFAULT_BAUDRATE, help='波特率')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='读超时(s)')
+    parser.add_argument('--startup-benchmark', action='store_true',
+                        help='窗口显示后立即退出，并输出启动耗时(JSON)')
+    parser.add_argument('--timing', action='store_true',
+                        help='分阶段计时，结果显示在状态栏并追加到timing.log')
+    parser.add_argument('--framing', choices=FRAMINGS, default=FRAMING_PLAIN,
+                        help='链路帧格式：plain每点2字节，packed每2点3字节，blocks为带序号和CRC的定长块（须与FPGA端一致）')
+    args, qt_args = parser.parse_known_args()
+    app = QApplication(sys.argv[:1] + qt_args)
+    ex = SignalAnalyzer(args.port, args.baudrate, args.timeout,
+                        auto_capture=not args.startup_benchmark,
+                        exit_after_startup=args.startup_benchmark, timing=args.timing,
+                        framing=args.framing)
     ex.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    code = app.exec_()
+    if args.startup_benchmark:
+        print(json.dumps(ex.startup_times))
+    sys.exit(code)
\ No newline at end of file
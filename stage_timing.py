@@ -0,0 +1,117 @@
+import json
+import logging
+import logging.handlers
+import time
+from contextlib import nullcontext
+
+# 计时日志文件：每次操作一行JSON，按大小轮转
+TIMING_LOG = 'timing.log'
+TIMING_LOG_BYTES = 1 << 20
+TIMING_LOG_BACKUPS = 3
+
+# 关闭计时时所有阶段共用的空上下文
+_NULL_STAGE = nullcontext()
+
+
+class _Stage:
+    def __init__(self, timer, name, samples, nbytes):
+        self.timer = timer
+        self.name = name
+        self.samples = samples
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, time.perf_counter() - self.t0, self.samples, self.nbytes)
+
+
+# 分阶段计时：记录每个阶段的耗时、点数、字节数和吞吐量，一次操作（一次采集、一次测量）
+# 结束时汇总为一行文字并追加到轮转日志；关闭时stage()返回共用的空上下文，record()不被调用
+class StageTimer:
+    def __init__(self, enabled=False, log_path=TIMING_LOG, max_bytes=TIMING_LOG_BYTES,
+                 backups=TIMING_LOG_BACKUPS):
+        self.enabled = enabled
+        self.operation = None       # 当前操作名称，None表示没有进行中的操作
+        self.records = []
+        self._t0 = None
+        self._logger = None
+        if enabled and log_path:
+            self._logger = logging.getLogger(f'stage_timing.{log_path}')
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            if not self._logger.handlers:
+                handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes,
+                                                               backupCount=backups, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                self._logger.addHandler(handler)
+
+    # 开始一次操作，清空之前的记录
+    def begin(self, operation):
+        if not self.enabled:
+            return
+        self.operation = operation
+        self.records = []
+        self._t0 = time.perf_counter()
+
+    # with timer.stage('fft', samples=n): ...
+    def stage(self, name, samples=0, nbytes=0):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, samples, nbytes)
+
+    # 直接记录一个阶段（由采集线程调用，list.append是线程安全的）
+    def record(self, name, seconds, samples=0, nbytes=0):
+        self.records.append({
+            'stage': name,
+            'ms': seconds * 1000,
+            'samples': samples,
+            'bytes': nbytes,
+            'samples_per_s': samples / seconds if seconds > 0 and samples else None,
+            'bytes_per_s': nbytes / seconds if seconds > 0 and nbytes else None,
+        })
+
+    # 包装一个函数，在有进行中的操作时记录它的耗时（如画布的draw）
+    def wrap(self, func, name):
+        def timed(*args, **kwargs):
+            if self.operation is None:
+                return func(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - t0)
+        return timed
+
+    # 一行文字的汇总，用于状态栏
+    def summary(self, total_ms=None):
+        parts = []
+        for r in self.records:
+            text = f"{r['stage']} {r['ms']:.1f}ms"
+            if r['bytes_per_s']:
+                text += f" {r['bytes_per_s'] / 1e3:.1f}kB/s"
+            elif r['samples_per_s']:
+                text += f" {r['samples_per_s'] / 1e6:.2f}MS/s"
+            parts.append(text)
+        if total_ms is not None:
+            parts.append(f'总计 {total_ms:.1f}ms')
+        return f'{self.operation}: ' + ' | '.join(parts)
+
+    # 结束当前操作：写入日志，返回汇总文字；没有进行中的操作时返回None
+    def finish(self):
+        if not self.enabled or self.operation is None:
+            return None
+        total_ms = (time.perf_counter() - self._t0) * 1000
+        text = self.summary(total_ms)
+        if self._logger is not None:
+            self._logger.info(json.dumps({
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'operation': self.operation,
+                'total_ms': total_ms,
+                'stages': self.records,
+            }, ensure_ascii=False))
+        self.operation = None
+        self.records = []
+        return text
@@ -0,0 +1,76 @@
+import json
+import struct
+import time
+import numpy as np
+from acquisition import FS
+from fpga_link import codes_to_volts, volts_to_adc_codes, calibration_json, STEADY_CALIBRATION
+
+# 二进制波形文件：魔数(8字节) + 头长度(uint32, 小端) + JSON头 + 样本数组
+# 样本为增益前的数据，float32电压或int16的12位码值，均为小端序；
+# 样本区按64字节对齐，可直接用np.memmap读取
+WAVEFORM_MAGIC = b'FPIWAVE1'
+WAVEFORM_SUFFIX = '.fpw'
+HEADER_ALIGN = 64
+SAMPLE_FORMATS = {'float32': '<f4', 'int16': '<i2'}
+
+
+# 保存波形，返回文件头
+# calibration: 采集时使用的修正参数；sample_format为'int16'时按该参数换算成码值保存
+# extra: 写入文件头的其他信息（如设备测量结果、触发点序号）
+def save_waveform(path, data, device=None, mode='steady', fs=FS, gain=1,
+                  calibration=STEADY_CALIBRATION, sample_format='float32', **extra):
+    if sample_format not in SAMPLE_FORMATS:
+        raise ValueError(f'不支持的样本格式: {sample_format}')
+    if sample_format == 'int16':
+        samples = volts_to_adc_codes(data, calibration).astype(SAMPLE_FORMATS['int16'])
+    else:
+        samples = np.ascontiguousarray(data, dtype=SAMPLE_FORMATS['float32'])
+    header = {
+        'device': device,
+        'mode': mode,
+        'fs': fs,
+        'gain': gain,
+        'calibration': calibration_json(calibration),
+        'format': sample_format,
+        'count': len(samples),
+        'created': time.time(),
+        **extra
+    }
+    text = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    prefix = len(WAVEFORM_MAGIC) + 4
+    size = -(-(prefix + len(text)) // HEADER_ALIGN) * HEADER_ALIGN
+    text = text.ljust(size - prefix, b' ')
+    with open(path, 'wb') as file:
+        file.write(WAVEFORM_MAGIC)
+        file.write(struct.pack('<I', len(text)))
+        file.write(text)
+        samples.tofile(file)
+    return header
+
+
+# 读取文件头，返回 (文件头, 样本区偏移)
+def read_waveform_header(path):
+    with open(path, 'rb') as file:
+        magic = file.read(len(WAVEFORM_MAGIC))
+        if magic != WAVEFORM_MAGIC:
+            raise ValueError(f'不是波形文件: {path}')
+        size, = struct.unpack('<I', file.read(4))
+        header = json.loads(file.read(size).decode('utf-8'))
+    return header, len(WAVEFORM_MAGIC) + 4 + size
+
+
+# 读取波形，样本为只读的np.memmap，不解析、不复制；返回 (文件头, 样本)
+def load_waveform(path):
+    header, offset = read_waveform_header(path)
+    dtype = np.dtype(SAMPLE_FORMATS[header['format']])
+    if not header['count']:
+        return header, np.empty(0, dtype=dtype)
+    samples = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(header['count'],))
+    return header, samples
+
+
+# 样本 -> 增益前的电压(float64)
+def waveform_volts(header, samples):
+    if header['format'] == 'int16':
+        return codes_to_volts(samples, header['calibration'])
+    return np.asarray(samples, dtype=np.float64)
@@ -0,0 +1,156 @@
+import json
+import sqlite3
+import time
+import zlib
+import numpy as np
+from acquisition import FS
+from device_store import DEVICES_DB
+from fpga_link import codes_to_volts, volts_to_adc_codes, calibration_json, STEADY_CALIBRATION
+
+# 每个设备保留的最近采集次数（按设备和模式分别计算）
+HISTORY_KEEP_LAST = 50
+# 所有历史波形压缩后的总大小上限(字节)，超出时删除最早的采集
+HISTORY_MAX_BYTES = 256 << 20
+# 每个压缩块的点数，读取部分波形时只解压用到的块
+HISTORY_CHUNK = 16384
+# zlib压缩级别
+HISTORY_LEVEL = 6
+
+
+# 每个块单独差分编码后压缩，可以独立解压
+def _pack(samples, fmt):
+    if fmt == 'int16':
+        samples = np.diff(samples.astype(np.int16), prepend=np.int16(0))
+    return zlib.compress(samples.astype('<i2' if fmt == 'int16' else '<f4').tobytes(), HISTORY_LEVEL)
+
+
+def _unpack(blob, fmt):
+    samples = np.frombuffer(zlib.decompress(blob), dtype='<i2' if fmt == 'int16' else '<f4')
+    if fmt == 'int16':
+        return np.cumsum(samples, dtype=np.int16)
+    return samples
+
+
+# 每台设备的历史波形：与设备信息在同一个数据库中，按 (设备, 模式, 时间) 建索引，
+# 波形分块压缩保存，按保留次数和总大小上限自动删除最早的采集
+class WaveformHistory:
+    def __init__(self, path=DEVICES_DB, keep_last=HISTORY_KEEP_LAST, max_bytes=HISTORY_MAX_BYTES):
+        self.keep_last = keep_last
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path, timeout=10)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS captures ('
+                              'id INTEGER PRIMARY KEY, device TEXT NOT NULL, mode TEXT NOT NULL, '
+                              'created REAL NOT NULL, fs REAL NOT NULL, gain REAL NOT NULL, '
+                              'calibration TEXT NOT NULL, format TEXT NOT NULL, count INTEGER NOT NULL, '
+                              'chunk INTEGER NOT NULL, size INTEGER NOT NULL, extra TEXT)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS captures_device_mode_created '
+                              'ON captures (device, mode, created)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS capture_chunks ('
+                              'capture_id INTEGER NOT NULL, seq INTEGER NOT NULL, data BLOB NOT NULL, '
+                              'PRIMARY KEY (capture_id, seq)) WITHOUT ROWID')
+
+    # 保存一次采集（增益前的电压），返回采集编号
+    # 数据能由码值精确还原时按12位码值差分压缩，否则按float32压缩
+    def add(self, device, mode, data, fs=FS, gain=1, calibration=STEADY_CALIBRATION, **extra):
+        data = np.asarray(data, dtype=np.float64)
+        codes = volts_to_adc_codes(data, calibration)
+        if np.allclose(codes_to_volts(codes, calibration), data, rtol=0, atol=1e-9):
+            fmt, samples = 'int16', codes
+        else:
+            fmt, samples = 'float32', data.astype(np.float32)
+        blobs = [_pack(samples[i:i + HISTORY_CHUNK], fmt) for i in range(0, len(samples), HISTORY_CHUNK)]
+        size = sum(len(blob) for blob in blobs)
+        with self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO captures (device, mode, created, fs, gain, calibration, format, count, '
+                'chunk, size, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (device, mode, time.time(), fs, gain, json.dumps(calibration_json(calibration)), fmt, len(samples),
+                 HISTORY_CHUNK, size, json.dumps(extra, ensure_ascii=False)))
+            capture_id = cursor.lastrowid
+            self.conn.executemany('INSERT INTO capture_chunks (capture_id, seq, data) VALUES (?, ?, ?)',
+                                  [(capture_id, seq, blob) for seq, blob in enumerate(blobs)])
+            self._evict(device, mode, capture_id)
+        return capture_id
+
+    # 删除超出保留次数和总大小上限的最早采集，刚保存的采集不删除
+    def _evict(self, device, mode, keep):
+        old = []
+        if self.keep_last is not None:
+            old += [row[0] for row in self.conn.execute(
+                'SELECT id FROM captures WHERE device = ? AND mode = ? ORDER BY created DESC LIMIT -1 OFFSET ?',
+                (device, mode, self.keep_last))]
+        if self.max_bytes is not None:
+            total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM captures').fetchone()[0]
+            rows = self.conn.execute('SELECT id, size FROM captures ORDER BY created').fetchall()
+            # 按保留次数删除的采集不再计入总大小
+            total -= sum(size for capture_id, size in rows if capture_id in old)
+            for capture_id, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if capture_id != keep and capture_id not in old:
+                    old.append(capture_id)
+                    total -= size
+        for capture_id in old:
+            self._delete(capture_id)
+
+    def _delete(self, capture_id):
+        self.conn.execute('DELETE FROM capture_chunks WHERE capture_id = ?', (capture_id,))
+        self.conn.execute('DELETE FROM captures WHERE id = ?', (capture_id,))
+
+    def delete(self, capture_id):
+        with self.conn:
+            self._delete(capture_id)
+
+    @staticmethod
+    def _info(row):
+        capture_id, device, mode, created, fs, gain, calibration, fmt, count, chunk, size, extra = row
+        return {'id': capture_id, 'device': device, 'mode': mode, 'created': created, 'fs': fs,
+                'gain': gain, 'calibration': json.loads(calibration), 'format': fmt, 'count': count,
+                'chunk': chunk, 'size': size, **json.loads(extra or '{}')}
+
+    # 某台设备的采集列表（最新的在前），不读取波形数据
+    def list(self, device, mode=None, limit=None):
+        sql = 'SELECT * FROM captures WHERE device = ?'
+        params = [device]
+        if mode is not None:
+            sql += ' AND mode = ?'
+            params.append(mode)
+        sql += ' ORDER BY created DESC LIMIT ?'
+        params.append(-1 if limit is None else limit)
+        return [self._info(row) for row in self.conn.execute(sql, params)]
+
+    # 某台设备某种模式的最近一次采集编号，没有时返回None
+    def latest(self, device, mode):
+        row = self.conn.execute('SELECT id FROM captures WHERE device = ? AND mode = ? '
+                                'ORDER BY created DESC LIMIT 1', (device, mode)).fetchone()
+        return row[0] if row else None
+
+    # 按编号读取采集的 [start, stop) 部分，只解压用到的块；返回 (采集信息, 增益前的电压)
+    def load(self, capture_id, start=0, stop=None):
+        row = self.conn.execute('SELECT * FROM captures WHERE id = ?', (capture_id,)).fetchone()
+        if row is None:
+            raise KeyError(capture_id)
+        info = self._info(row)
+        stop = info['count'] if stop is None else min(stop, info['count'])
+        start = max(start, 0)
+        if stop <= start:
+            return info, np.empty(0)
+        chunk = info['chunk']
+        first, last = start // chunk, (stop - 1) // chunk
+        blobs = self.conn.execute('SELECT data FROM capture_chunks WHERE capture_id = ? AND seq BETWEEN ? AND ? '
+                                  'ORDER BY seq', (capture_id, first, last))
+        samples = np.concatenate([_unpack(blob, info['format']) for blob, in blobs])
+        samples = samples[start - first * chunk:stop - first * chunk]
+        if info['format'] == 'int16':
+            return info, codes_to_volts(samples, info['calibration'])
+        return info, samples.astype(np.float64)
+
+    # 所有历史波形压缩后的总大小(字节)
+    def total_bytes(self):
+        return self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM captures').fetchone()[0]
+
+    def close(self):
+        self.conn.close()